@@ -0,0 +1,339 @@
+import asyncio
+from collections import deque
+import time
+import os
+import threading
+import traceback
+import blobstore
+import diskwriter
+import scraper
+import throttle
+from pagecache import PageCache
+from metrics import Metrics
+from downloader import (
+    NAME_RE, SyncState, build_url, dedup_rows, filter_article, filter_rows, index_media, indexed_media, media_filename,
+    media_probe, prepare_download, probe_needed, reuse_media, save_metrics, select_filter, select_media, start_digest
+)
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+
+# asyncio engine, same inputs and file layout as downloader.Downloader
+# the event loop runs on this thread so the tk mainloop is never blocked
+class AsyncDownloader(threading.Thread):
+    def __init__(
+            self, gui, selected_ch, selected_cat, startpg: int, endpg: int, filter_mode: int, best: bool, sync=False
+    ):
+        threading.Thread.__init__(self)
+        self.gui = gui
+        self.selected_ch = selected_ch
+        self.selected_cat = selected_cat
+        self.startpg = startpg
+        self.endpg = endpg
+        self.filter_mode = filter_mode
+        self.best = best
+        self.articles = gui.history.channel(selected_ch['channel_url'])
+        self.cache = gui.page_cache
+        self.sync = SyncState(gui, selected_ch, selected_cat, best) if sync else None
+        self.article_workers = gui.data.get('article_workers', 2)
+        self.article_queue = gui.data.get('article_queue', 32)
+        self.listing_workers = gui.data.get('listing_workers', 4)
+        # in-flight media requests, cheap on a single loop
+        self.media_limit = gui.data.get('async_limit', 100)
+        self.chunk_size = gui.data.get('chunk_size', 65536)
+        self.blobs = blobstore.open_store(gui, gui.data['dl_location'] or '.')
+        self.session = None
+        self.media_slots = None
+        self.media_tasks = set()
+        self.saved = 0
+        self.failures = []
+        self.error = None
+        self.metrics = Metrics()
+        self.writer = None
+        self.verify_media = gui.data.get('verify_media', False)
+        self.order = gui.data.get('media_order', 'document')
+
+    def run(self):
+        try:
+            if aiohttp is None:
+                raise Exception('async engine needs aiohttp: pip install aiohttp')
+            asyncio.run(self.temp_download())
+        except Exception:
+            self.error = traceback.format_exc()
+            self.gui.log('failed download:', essential=True)
+            self.gui.log(self.error, essential=True)
+        save_metrics(self.gui, self.metrics, self.selected_ch, self.selected_cat, 'async', self.result())
+        self.gui.root.event_generate('<<DownloadComplete>>')
+
+    def result(self):
+        return {'saved': self.saved, 'failed': len(self.failures), 'error': self.error}
+
+    async def temp_download(self):
+        s = time.perf_counter()
+        _filter = select_filter(self.gui.data, self.selected_ch, self.filter_mode)
+        ch_url, cat_url = self.selected_ch['channel_url'], self.selected_cat[0]
+        dl_path = prepare_download(self.gui, self.selected_ch, self.selected_cat, self.startpg, self.endpg)
+        pending = self.gui.history.pending(ch_url)
+
+        self.media_slots = asyncio.Semaphore(self.media_limit)
+        self.writer = diskwriter.open_writer(self.gui, self.metrics)
+        connector = aiohttp.TCPConnector(limit=self.media_limit + self.article_workers + self.listing_workers)
+        # no total limit, large videos take longer than aiohttp's default 5 minutes
+        # connect and read timeouts like sessions.TimeoutSession
+        timeout = aiohttp.ClientTimeout(
+            total=None, sock_connect=self.gui.data.get('connect_timeout', 10),
+            sock_read=self.gui.data.get('read_timeout', 60)
+        )
+        async with aiohttp.ClientSession(connector=connector, timeout=timeout) as self.session:
+            article_queue = asyncio.Queue(maxsize=self.article_queue)
+            workers = [
+                asyncio.create_task(self.article_worker(article_queue, _filter, dl_path))
+                for _ in range(self.article_workers)
+            ]
+            # listing pages in flight, handled in page order
+            pages = iter(range(self.startpg, self.endpg + 1))
+            listings = deque()
+            # see downloader.Downloader.listings
+            depth = 1 if self.sync else self.listing_workers
+            try:
+                # finish media of articles an interrupted run left behind
+                if pending:
+                    self.gui.log(f'resuming {len(pending)} unfinished articles', essential=True)
+                for article_id, items in pending.items():
+                    await self.queue(items, (ch_url, article_id), resume=True)
+                # resumed articles are already queued, see downloader.Downloader.temp_download
+                seen = set(pending)
+                while True:
+                    for page in pages:
+                        self.gui.log(f'requesting page {page}')
+                        url = build_url(ch_url, cat_url, page, best=self.best)
+                        listings.append(asyncio.create_task(self.get_rows(url)))
+                        if len(listings) >= depth:
+                            break
+                    if not listings:
+                        break
+                    if self.gui.destroy:
+                        raise Exception('thread stopped')
+                    if self.error:
+                        break
+                    rows = dedup_rows(await listings.popleft(), seen)
+                    with self.metrics.time('listing_filter'):
+                        article_urls = filter_rows(rows, _filter, self.articles, self.gui.log, self.metrics)
+                    for article_url in article_urls:
+                        await article_queue.put(article_url)
+                    if self.sync:
+                        if self.sync.scan(rows, self.articles):
+                            break
+                        depth = min(depth * 2, self.listing_workers)
+                # workers exit after draining the queue
+                for _ in workers:
+                    await article_queue.put(None)
+                await asyncio.gather(*workers)
+                if self.error:
+                    raise Exception('article download failed:\n' + self.error)
+                await asyncio.gather(*self.media_tasks)
+            finally:
+                for task in workers + list(listings) + list(self.media_tasks):
+                    task.cancel()
+                self.writer.close()
+        self.gui.log(f'\nmedia: {self.saved} saved, {len(self.failures)} failed', essential=True)
+        self.writer.report(self.gui.log)
+        if self.blobs:
+            self.blobs.report(self.gui.log)
+        if self.sync:
+            self.sync.commit()
+        e = time.perf_counter()
+        self.gui.log(f'\ndownload complete in {e - s}s\n', essential=True)
+
+    async def get_rows(self, url):
+        # same caching as downloader.Downloader.get_rows
+        entry = self.cache.lookup(url) if self.cache else None
+        if entry and self.cache.fresh(entry):
+            self.gui.log('page cached')
+            self.metrics.add('page_cached')
+            return self.cache.rows(entry)
+        headers = PageCache.request_headers(entry)
+        start = time.perf_counter()
+        r = await throttle.get_async(self.session, url, cookies={'allow_sensitive_media': 'true'}, headers=headers)
+        async with r:
+            if entry and r.status == 304:
+                self.gui.log('page not modified')
+                self.metrics.add('page_not_modified')
+                self.cache.touch(url)
+                return self.cache.rows(entry)
+            throttle.check_page(r.status)
+            body = await r.read()
+            text = body.decode(r.get_encoding())
+            response_headers = r.headers
+        self.metrics.observe('listing_fetch', time.perf_counter() - start)
+        self.metrics.add('listing_bytes', len(body))
+        with self.metrics.time('listing_parse'):
+            rows = await scraper.parse_async(scraper.parse_listing, text)
+        if self.cache:
+            self.cache.store(url, response_headers, rows)
+        return rows
+
+    async def article_worker(self, article_queue, settings: dict, dl_path):
+        while True:
+            article_url = await article_queue.get()
+            if article_url is None:
+                return
+            # keep draining so the producer never blocks on a full queue
+            if self.gui.destroy or self.error:
+                continue
+            try:
+                await self.get_article('https://arca.live' + article_url, settings, dl_path)
+            except Exception:
+                self.error = traceback.format_exc()
+
+    async def get_article(self, article_url, settings: dict, dl_path):
+        self.gui.log('getting article:', article_url)
+        start = time.perf_counter()
+        try:
+            async with await throttle.get_async(self.session, article_url) as r:
+                if r.status in throttle.SKIP_STATUS:
+                    self.gui.log(f'skipped: http status {r.status}', essential=True)
+                    self.metrics.skip('http_status')
+                    return
+                throttle.check_page(r.status)
+                reader = scraper.ArticleReader(scraper.body_length(r.headers))
+                async for chunk in r.content.iter_chunked(scraper.ARTICLE_CHUNK):
+                    if reader.feed(chunk):
+                        break
+                text = reader.text(r.charset)
+        except Exception as expt:
+            # same as downloader.Downloader.get_article
+            if not throttle.transient(expt):
+                raise
+            self.gui.log(f'skipped: {article_url} ({expt})', essential=True)
+            self.metrics.skip('http_error')
+            return
+        self.metrics.observe('article_fetch', time.perf_counter() - start)
+        self.metrics.add('article_bytes', reader.size)
+        with self.metrics.time('article_parse'):
+            article = await scraper.parse_async(scraper.parse_article, text)
+        with self.metrics.time('article_filter'):
+            src_list = filter_article(article, settings, self.gui.log, self.metrics)
+        if src_list is None:
+            return
+        match = NAME_RE.search(article_url)
+        # Does not add article number if not matched
+        prefix = None
+        article = None
+        if match:
+            prefix = f'{match.group(1)}-{match.group(2)}-'
+            article = (self.selected_ch['channel_url'], match.group(2))
+        items = [(src, dl_path + media_filename(prefix, i, src)) for i, src in enumerate(src_list)]
+        if probe_needed(settings, self.order):
+            probes = await asyncio.gather(*(self.probe(src) for src, _ in items))
+            items = select_media(items, probes, settings, self.order, self.gui.log, self.metrics)
+        if article:
+            await self.blocking(self.gui.history.begin, *article, items)
+        for src in src_list:
+            self.gui.log(f'downloading: {src}')
+        await self.queue(items, article)
+
+    async def queue(self, items, article=None, resume=False):
+        for src, path in items:
+            # backpressure: wait for a free slot before creating the task
+            await self.media_slots.acquire()
+            task = asyncio.create_task(self.fetch(src, path, article, resume))
+            self.media_tasks.add(task)
+            task.add_done_callback(self.media_tasks.discard)
+
+    async def fetch(self, src, path, article=None, resume=False):
+        # same temp file, range continuation and media index as downloader.MediaPool.fetch
+        try:
+            if not (resume and os.path.exists(path)):
+                saved = await self.blocking(indexed_media, self.gui.history, src)
+                if saved and self.verify_media and not await self.same_size(src, saved[1]):
+                    saved = None
+                if saved:
+                    await self.blocking(reuse_media, saved[0], path)
+                    self.gui.log(f'already downloaded: {src}')
+                    self.metrics.add('media_indexed')
+                    self.metrics.add('media_indexed_bytes', saved[1])
+                else:
+                    await self.transfer(src, path)
+        except Exception as expt:
+            self.failures.append(src)
+            self.metrics.add('media_failed')
+            self.gui.log(f'failed: {src} ({expt})', essential=True)
+            if article and throttle.gone(expt):
+                self.gui.log(f'giving up: {src}', essential=True)
+                if await self.blocking(self.gui.history.media_done, *article, src):
+                    self.gui.log(f'article complete: {article[1]}')
+        else:
+            self.saved += 1
+            self.gui.log(f'saved: {path}')
+            if article and await self.blocking(self.gui.history.media_done, *article, src):
+                self.gui.log(f'article complete: {article[1]}')
+        finally:
+            self.media_slots.release()
+
+    async def transfer(self, src, path):
+        temp_path = path + '.part'
+        offset = os.path.getsize(temp_path) if os.path.exists(temp_path) else 0
+        headers = {'Range': f'bytes={offset}-'} if offset else {}
+        start = time.perf_counter()
+        async with await throttle.get_async(self.session, src, headers=headers) as r:
+            self.metrics.observe('media_ttfb', time.perf_counter() - start)
+            if r.status == 416:
+                os.remove(temp_path)
+                raise Exception('range not satisfiable')
+            throttle.check_media(r.status, r.headers.get('Content-Type'))
+            mode = 'ab' if offset and r.status == 206 else 'wb'
+            digest = await self.blocking(start_digest, temp_path if mode == 'ab' else None) if self.blobs else None
+            start = time.perf_counter()
+            size = 0
+            handle = self.writer.open(temp_path, mode)
+            try:
+                async for chunk in r.content.iter_chunked(self.chunk_size):
+                    if self.gui.destroy:
+                        raise Exception('thread stopped')
+                    # the loop never blocks on the writer's byte budget
+                    while not handle.write(chunk, block=False):
+                        await asyncio.sleep(0.01)
+                    size += len(chunk)
+                    if digest:
+                        digest.update(chunk)
+            finally:
+                handle.close()
+            self.metrics.observe('media_transfer', time.perf_counter() - start)
+            self.metrics.add('media_bytes', size)
+        await self.blocking(handle.wait)
+        await self.blocking(self.finish, src, temp_path, path, digest)
+
+    def finish(self, src, temp_path, path, digest):
+        if digest:
+            self.blobs.store(temp_path, path, digest.hexdigest())
+        else:
+            os.replace(temp_path, path)
+        index_media(self.gui.history, src, path, digest)
+
+    async def blocking(self, func, *args):
+        # disk copies, hashing and history writes run on the default executor, transfers keep going meanwhile
+        return await asyncio.get_running_loop().run_in_executor(None, func, *args)
+
+    async def probe(self, src):
+        # same as downloader.MediaPool.probe
+        try:
+            async with await throttle.head_async(self.session, src) as r:
+                if r.status >= 400:
+                    return None, None
+                return media_probe(src, r.headers.get('Content-Length'), r.headers.get('Content-Type'))
+        except throttle.async_errors():
+            return None, None
+
+    async def same_size(self, src, size):
+        # same as downloader.MediaPool.same_size
+        try:
+            async with await throttle.head_async(self.session, src) as r:
+                length = r.headers.get('Content-Length')
+                status = r.status
+        except throttle.async_errors():
+            return True
+        return status >= 400 or not length or int(length) == size
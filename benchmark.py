@@ -0,0 +1,356 @@
+import argparse
+import http.server
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import requests
+from urllib.parse import urlsplit, parse_qs
+from requests.adapters import HTTPAdapter
+import config
+import downloader
+import history
+import scraper
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+# offline benchmark: the engines run against a local stand-in for arca.live, results are appended to RESULTS_PATH
+RESULTS_PATH = 'benchmark_results.jsonl'
+CHANNEL = 'bench'
+FIRST_ID = 1000000
+
+# the real site puts several classes on most elements, the stand-in does too so strained parsing is exercised
+LISTING = '<html><head><title>{channel}</title></head><body><div class="list-table table">{rows}</div></body></html>'
+NOTICE = (
+    '<a class="vrow notice" href="/b/{channel}/1"><span class="title">notice</span>'
+    '<div class="vrow-preview"></div></a>'
+)
+ROW = (
+    '<a class="vrow" href="/b/{channel}/{id}"><span class="title">benchmark article {id}</span>'
+    '<span class="badge">bench</span><span class="col-rate">{rate}</span><div class="vrow-preview"></div></a>'
+)
+ARTICLE = (
+    '<html><head><title>benchmark article {id}</title></head><body>'
+    '<div class="article-info article-info-section"><span class="head">up</span><span class="body">{rate}</span>'
+    '<span class="sep"></span><span class="head">down</span><span class="body">0</span></div>'
+    '<div class="fr-view article-content"><p>{text}</p>{media}</div>'
+    '<div class="article-comment">{comments}</div></body></html>'
+)
+IMG = '<img src="//arca.live/media/{id}-{i}.jpg">'
+VIDEO = '<video src="//arca.live/media/{id}-{i}.mp4"></video>'
+CHANNEL_PAGE = (
+    '<html><head><title>{channel}</title></head><body><div class="board-title clearfix"><a href="/">arca</a>'
+    '<a href="/b/{channel}">{channel} channel</a></div><div class="board-category main">'
+    '<a href="/b/{channel}">all</a><a href="/b/{channel}?category=bench">bench</a></div></body></html>'
+)
+COMMENT = '<div class="comment-item"><span class="user-info">user{i}</span><div class="message">comment {i}</div></div>'
+
+
+# serves listing pages, articles and media of the configured sizes, each response after the configured latency
+# and each new connection after connect_latency, standing in for the tcp and tls handshake
+class StandIn(http.server.ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, rows=20, media=3, media_size=262144, comments=50, latency=0.0, connect_latency=0.0):
+        http.server.ThreadingHTTPServer.__init__(self, ('127.0.0.1', 0), StandInHandler)
+        self.rows = rows
+        self.media = media
+        self.blob = b'\0' * media_size
+        self.comments = ''.join(COMMENT.format(i=i) for i in range(comments))
+        self.latency = latency
+        self.connect_latency = connect_latency
+        self.lock = threading.Lock()
+        self.counts = {'page': 0, 'article': 0, 'media': 0, 'connection': 0}
+        self.sent = 0
+
+    def url(self):
+        return f'http://127.0.0.1:{self.server_address[1]}'
+
+    def handle_error(self, request, client_address):
+        # the article fetch drops connections after the comments marker
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            http.server.ThreadingHTTPServer.handle_error(self, request, client_address)
+
+    def count(self, kind, size):
+        with self.lock:
+            self.counts[kind] += 1
+            self.sent += size
+
+    def listing(self, page):
+        first = FIRST_ID - (page - 1) * self.rows
+        rows = NOTICE.format(channel=CHANNEL) + ''.join(
+            ROW.format(channel=CHANNEL, id=first - k, rate=k % 10) for k in range(self.rows)
+        )
+        return LISTING.format(channel=CHANNEL, rows=rows)
+
+    def article(self, article_id):
+        media = ''.join(
+            (VIDEO if i % 3 == 2 else IMG).format(id=article_id, i=i) for i in range(self.media)
+        )
+        return ARTICLE.format(
+            id=article_id, rate=article_id % 10, text='benchmark ' * 50, media=media, comments=self.comments
+        )
+
+
+class StandInHandler(http.server.BaseHTTPRequestHandler):
+    # keep-alive like the real site
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def handle(self):
+        # once per connection, the requests on it follow
+        self.server.count('connection', 0)
+        if self.server.connect_latency:
+            time.sleep(self.server.connect_latency)
+        http.server.BaseHTTPRequestHandler.handle(self)
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        parts = url.path.strip('/').split('/')
+        if parts[0] == 'media':
+            kind, body, content_type = 'media', self.server.blob, 'image/jpeg'
+        elif parts[:2] == ['b', CHANNEL] and len(parts) == 3:
+            kind, body = 'article', self.server.article(int(parts[2])).encode()
+            content_type = 'text/html; charset=utf-8'
+        elif parts[:2] == ['b', CHANNEL]:
+            page = int(parse_qs(url.query).get('p', ['1'])[0])
+            kind, body = 'page', self.server.listing(page).encode()
+            content_type = 'text/html; charset=utf-8'
+        else:
+            self.send_error(404)
+            return
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.server.count(kind, len(body))
+        self.wfile.write(body)
+
+
+# sends every https request to the stand-in and records the time to the response headers
+class StandInAdapter(HTTPAdapter):
+    def __init__(self, base, size):
+        HTTPAdapter.__init__(self, pool_connections=size, pool_maxsize=size)
+        self.base = base
+        self.lock = threading.Lock()
+        self.ttfb = []
+
+    def send(self, request, **kwargs):
+        url = urlsplit(request.url)
+        request.url = self.base + url.path + ('?' + url.query if url.query else '')
+        start = time.perf_counter()
+        r = HTTPAdapter.send(self, request, **kwargs)
+        with self.lock:
+            self.ttfb.append(time.perf_counter() - start)
+        return r
+
+
+# stands in for main.GUI, like headless.Context without settings or history files
+class BenchContext:
+    def __init__(self, data, verbose=False):
+        self.data = data
+        self.history = history.ArticleHistory(':memory:')
+        self.page_cache = None
+        self.verbose = verbose
+        self.destroy = False
+        self.root = self
+
+    def event_generate(self, sequence):
+        pass
+
+    def log(self, *args: str, sep=' ', end='\n', essential=False):
+        if self.verbose:
+            sys.stderr.write(sep.join(args) + end)
+
+
+def check_parsers():
+    # strained parsing has to extract exactly what a full parse does, raises on the first difference
+    pages = [
+        (scraper.parse_listing, LISTING.format(
+            channel=CHANNEL, rows=NOTICE.format(channel=CHANNEL) + ROW.format(channel=CHANNEL, id=FIRST_ID, rate=3)
+        )),
+        (scraper.parse_article, ARTICLE.format(
+            id=FIRST_ID, rate=3, text='check', media=IMG.format(id=FIRST_ID, i=0) + VIDEO.format(id=FIRST_ID, i=1),
+            comments=COMMENT.format(i=0)
+        )),
+        (scraper.parse_channel, CHANNEL_PAGE.format(channel=CHANNEL))
+    ]
+    backend, strain = 'lxml' if scraper.BACKEND == 'lxml' else 'html.parser', scraper.STRAIN
+    try:
+        for func, text in pages:
+            results = []
+            for strained in (True, False):
+                scraper.set_backend(backend, strained)
+                results.append(func(text))
+            if results[0] != results[1]:
+                raise Exception(f'{func.__name__}: strained {results[0]} != unstrained {results[1]}')
+            if not results[0] or not all(results[0].values() if isinstance(results[0], dict) else results[0]):
+                raise Exception(f'{func.__name__}: nothing extracted: {results[0]}')
+    finally:
+        scraper.set_backend(backend, strain)
+
+
+def peak_rss():
+    # MB, None where the resource module is missing (windows)
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on linux, bytes on macos
+    return rss / (1048576 if sys.platform == 'darwin' else 1024)
+
+
+def version():
+    try:
+        out = subprocess.run(
+            ['git', 'describe', '--always', '--dirty'], capture_output=True, text=True,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        )
+    except OSError:
+        return None
+    return out.stdout.strip() or None
+
+
+def run(scenario='channel', pages=5, rows=20, media=3, media_size=262144, comments=50, latency=0.0,
+        connect_latency=0.0, article_workers=2, media_workers=4, parse_processes=0, verbose=False):
+    # one benchmark run, returns the result record
+    scraper.set_processes(parse_processes)
+    server = StandIn(rows, media, media_size, comments, latency, connect_latency)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    adapter = StandInAdapter(server.url(), article_workers + media_workers + 1)
+    session = requests.Session()
+    session.mount('https://', adapter)
+    temp = tempfile.mkdtemp(prefix='arca_bench_')
+    cwd = os.getcwd()
+    data = config.create_default()
+    data.update({
+        'dl_mode': 1, 'dl_location': temp, 'page_cache': False, 'dedup': False, 'metrics_file': None,
+        'article_workers': article_workers, 'media_workers': media_workers
+    })
+    context = BenchContext(data, verbose)
+    try:
+        start = time.perf_counter()
+        if scenario == 'channel':
+            ch = {'channel_url': f'https://arca.live/b/{CHANNEL}', 'channel_name': CHANNEL}
+            job = downloader.Downloader(context, ch, [f'/b/{CHANNEL}', 'all'], 1, pages, 0, False, False, session)
+        else:
+            # PageDownloader saves under the working directory
+            os.chdir(temp)
+            job = downloader.PageDownloader(context, f'https://arca.live/b/{CHANNEL}/{FIRST_ID}', session)
+        job.run()
+        elapsed = time.perf_counter() - start
+        error = getattr(job, 'error', None)
+        saved, failed = job.pool.saved, len(job.pool.failures)
+        stages = job.pool.metrics.report()['stages']
+    finally:
+        os.chdir(cwd)
+        server.shutdown()
+        server.server_close()
+        session.close()
+        context.history.close()
+        scraper.close()
+        shutil.rmtree(temp, ignore_errors=True)
+    ttfb = sorted(adapter.ttfb)
+    return {
+        'version': version(),
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'parser': scraper.BACKEND,
+        'scenario': scenario,
+        'params': {
+            'pages': pages, 'rows': rows, 'media': media, 'media_size': media_size, 'comments': comments,
+            'latency': latency, 'connect_latency': connect_latency, 'article_workers': article_workers, 'media_workers': media_workers,
+            'parse_processes': parse_processes
+        },
+        'elapsed': round(elapsed, 3),
+        'pages_per_s': round(server.counts['page'] / elapsed, 2),
+        'articles_per_s': round(server.counts['article'] / elapsed, 2),
+        'connections': server.counts['connection'],
+        'mb_per_s': round(saved * media_size / 1048576 / elapsed, 2),
+        'peak_rss_mb': round(peak_rss(), 1) if resource else None,
+        'ttfb_ms': {
+            'median': round(statistics.median(ttfb) * 1000, 2) if ttfb else None,
+            'p95': round(ttfb[int(len(ttfb) * 0.95)] * 1000, 2) if ttfb else None
+        },
+        'stages_ms': {stage: round(stats['mean'] * 1000, 3) for stage, stats in stages.items()},
+        'saved': saved,
+        'failed': failed,
+        'error': error
+    }
+
+
+def save(result, path=RESULTS_PATH):
+    with open(path, 'a', encoding='utf-8') as f:
+        f.write(json.dumps(result) + '\n')
+
+
+def show(path=RESULTS_PATH):
+    # stored results, oldest first
+    if not os.path.exists(path):
+        print(f'no results in {path}')
+        return
+    print(f'{"version":<20}{"scenario":<10}{"pages/s":>10}{"articles/s":>12}{"MB/s":>10}{"rss MB":>10}{"ttfb ms":>10}')
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            r = json.loads(line)
+            print(
+                f'{str(r["version"]):<20}{r["scenario"]:<10}{r["pages_per_s"]:>10}{r["articles_per_s"]:>12}'
+                f'{r["mb_per_s"]:>10}{str(r["peak_rss_mb"]):>10}{str(r["ttfb_ms"]["median"]):>10}'
+            )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the download engines against a local arca.live stand-in')
+    parser.add_argument('scenario', nargs='?', choices=['channel', 'page'], default='channel',
+                        help='channel: Downloader over listing pages, page: PageDownloader on one article')
+    parser.add_argument('--pages', type=int, default=5)
+    parser.add_argument('--rows', type=int, default=20, help='articles per listing page')
+    parser.add_argument('--media', type=int, default=3, help='media per article')
+    parser.add_argument('--media-size', type=int, default=262144, help='bytes per media file')
+    parser.add_argument('--comments', type=int, default=50, help='comments per article')
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds before every response')
+    parser.add_argument('--connect-latency', type=float, default=0.0, help='seconds before every new connection')
+    parser.add_argument('--article-workers', type=int, default=2)
+    parser.add_argument('--media-workers', type=int, default=4)
+    parser.add_argument('--parse-processes', type=int, default=0, help='parse in worker processes, 0: in the engine')
+    parser.add_argument('--repeat', type=int, default=1)
+    parser.add_argument('--results', default=RESULTS_PATH)
+    parser.add_argument('--no-save', action='store_true', help='print the results without storing them')
+    parser.add_argument('--show', action='store_true', help='print the stored results and exit')
+    parser.add_argument('--check', action='store_true', help='only compare strained and full parsing')
+    parser.add_argument('-v', '--verbose', action='store_true', help='print the engine log to stderr')
+    args = parser.parse_args(argv)
+
+    if args.show:
+        show(args.results)
+        return 0
+    check_parsers()
+    if args.check:
+        print('parsers ok')
+        return 0
+    for _ in range(args.repeat):
+        result = run(
+            args.scenario, args.pages, args.rows, args.media, args.media_size, args.comments, args.latency,
+            args.connect_latency, args.article_workers, args.media_workers, args.parse_processes, args.verbose
+        )
+        print(json.dumps(result))
+        if not args.no_save:
+            save(result, args.results)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,58 @@
+import re
+
+
+# blacklist words compiled into one regex shaped like a trie of the words
+# the regex engine then follows at most one branch per character, so a search does not slow down as the list grows
+class Blacklist:
+    def __init__(self, words=(), normalize=False):
+        # normalize: ignore case and treat any run of whitespace as one space
+        self.normalize = normalize
+        self.words = {}
+        for word in words:
+            key = self.fold(word)
+            # first entry wins, its original spelling is reported
+            self.words.setdefault(key, word)
+        self.pattern = re.compile(trie_pattern(self.words)) if self.words else None
+
+    def fold(self, text):
+        if self.normalize:
+            return ' '.join(text.casefold().split())
+        return text
+
+    def search(self, text):
+        # returns the blacklisted word found in text, None if there is none
+        if self.pattern is None:
+            return None
+        match = self.pattern.search(self.fold(text))
+        if match is None:
+            return None
+        return self.words[match.group()]
+
+    def __bool__(self):
+        return self.pattern is not None
+
+
+def trie_pattern(words):
+    trie = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[''] = True
+    return node_pattern(trie)
+
+
+def node_pattern(node):
+    # a word ending at this node is optional when longer words continue from it
+    # longer branches come first so the longest word at a position is matched
+    end = '' in node
+    branches = [re.escape(char) + node_pattern(child) for char, child in sorted(node.items()) if char]
+    if not branches:
+        return ''
+    if len(branches) == 1:
+        body = branches[0]
+        if end:
+            return f'(?:{body})?'
+        return body
+    body = '(?:' + '|'.join(branches) + ')'
+    return body + '?' if end else body
@@ -0,0 +1,51 @@
+import os
+import shutil
+import threading
+
+
+BLOB_DIR = '.arca_blobs'
+
+
+def open_store(gui, root):
+    # returns None unless deduplication is turned on
+    if not gui.data.get('dedup', False):
+        return None
+    return BlobStore(os.path.join(root, BLOB_DIR), gui.history)
+
+
+# content addressed media store, one blob per sha256
+# downloaded names become hardlinks to the blob, so the store has to be on the same drive as the files
+class BlobStore:
+    def __init__(self, root, history):
+        self.root = root
+        self.history = history
+        self.lock = threading.Lock()
+        # this run
+        self.duplicates = 0
+        self.saved_bytes = 0
+
+    def store(self, temp_path, path, digest):
+        # moves a finished temp file into the store and links it to path, returns True if it was a duplicate
+        size = os.path.getsize(temp_path)
+        blob = os.path.join(self.root, digest[:2], digest)
+        with self.lock:
+            os.makedirs(os.path.dirname(blob), exist_ok=True)
+            duplicate = os.path.exists(blob)
+            if duplicate:
+                os.remove(temp_path)
+                self.duplicates += 1
+                self.saved_bytes += size
+            else:
+                os.replace(temp_path, blob)
+            if os.path.exists(path):
+                os.remove(path)
+            try:
+                os.link(blob, path)
+            except OSError:
+                # no hardlink support on this drive, keep a plain copy
+                shutil.copyfile(blob, path)
+        self.history.add_blob(digest, size)
+        return duplicate
+
+    def report(self, log):
+        log(f'dedup: {self.duplicates} duplicates, {self.saved_bytes / 1048576:.1f}MB saved', essential=True)
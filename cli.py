@@ -0,0 +1,114 @@
+import argparse
+import json
+import sys
+import config
+import history
+
+
+# exit codes
+OK = 0
+FAILED = 1
+USAGE = 2
+STOPPED = 130
+
+
+def parse_pages(text):
+    start, _, end = text.partition('-')
+    return int(start), int(end or start)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='arca-downloader', description='Download arca.live channels without the GUI')
+    parser.add_argument('channel', nargs='?', help='registered channel name or url')
+    parser.add_argument('-c', '--category', help='category name (default: all)')
+    parser.add_argument('-p', '--pages', default='1', help='page or page range, e.g. 1-5 (default: 1)')
+    parser.add_argument('-f', '--filter', choices=['none', 'default', 'channel'], help="default: channel's setting")
+    parser.add_argument('-b', '--best', action='store_true', help='download best articles')
+    parser.add_argument('-s', '--sync', action='store_true', help='download new articles from page 1')
+    parser.add_argument('-e', '--engine', choices=['thread', 'async'], help='default: settings')
+    parser.add_argument('-l', '--list', action='store_true', help='list registered channels and categories')
+    parser.add_argument('-a', '--all', action='store_true', help='download every registered channel')
+    parser.add_argument('-j', '--jobs', type=int, default=4, help='channels downloaded at once with --all')
+    parser.add_argument(
+        '--connections', type=int, default=16, help='connection limit per host shared by all jobs with --all'
+    )
+    parser.add_argument('--settings', default=config.SETTINGS_PATH)
+    parser.add_argument('--history', default=history.HISTORY_PATH)
+    parser.add_argument('--json', action='store_true', help='print the result as json to stdout')
+    parser.add_argument('-v', '--verbose', action='store_true', help='log everything to stderr')
+    args = parser.parse_args(argv)
+
+    # imported here so --help stays fast
+    import headless
+
+    try:
+        context = headless.Context(args.settings, args.history, args.verbose)
+    except Exception as expt:
+        sys.stderr.write(f'could not load settings: {expt}\n')
+        return USAGE
+    try:
+        if args.list:
+            channels = [
+                {'channel': ch['channel_name'], 'url': ch['channel_url'],
+                 'categories': [cat[1] for cat in ch['channel_category']]}
+                for ch in context.data['channels']
+            ]
+            if args.json:
+                print(json.dumps(channels, ensure_ascii=False))
+            else:
+                for ch in channels:
+                    print(f'{ch["channel"]}\t{ch["url"]}\t{", ".join(ch["categories"])}')
+            return OK
+        if args.all:
+            return run_all(context, args)
+        if not args.channel:
+            parser.print_usage(sys.stderr)
+            return USAGE
+        try:
+            startpg, endpg = parse_pages(args.pages)
+            result = headless.download(
+                context, args.channel, args.category, startpg, endpg, args.filter, args.best, args.sync,
+                args.engine or context.data.get('engine', 'thread')
+            )
+        except ValueError as expt:
+            sys.stderr.write(f'{expt}\n')
+            return USAGE
+        except KeyboardInterrupt:
+            return STOPPED
+        if args.json:
+            print(json.dumps(result, ensure_ascii=False))
+        else:
+            print(f'{result["channel"]}/{result["category"]}: {result["saved"]} saved, {result["failed"]} failed')
+        return FAILED if result['error'] or result['failed'] else OK
+    finally:
+        context.close()
+
+
+def run_all(context, args):
+    # the jobs share one requests session, only the thread engine takes it
+    if args.engine == 'async':
+        sys.stderr.write('--all runs on the thread engine, -e async is not supported\n')
+        return USAGE
+    import scheduler
+
+    try:
+        startpg, endpg = parse_pages(args.pages)
+    except ValueError as expt:
+        sys.stderr.write(f'{expt}\n')
+        return USAGE
+    jobs = scheduler.all_channels(context, startpg, endpg, args.filter, args.best, args.sync)
+    try:
+        results = scheduler.BatchScheduler(context, args.jobs, args.connections).run(jobs)
+    except KeyboardInterrupt:
+        return STOPPED
+    if args.json:
+        print(json.dumps(results, ensure_ascii=False))
+    else:
+        for result in results:
+            print(f'{result["channel"]}: {result["saved"]} saved, {result["failed"]} failed'
+                  + (' (error)' if result['error'] else ''))
+    return FAILED if any(result['error'] or result['failed'] for result in results) else OK
+
+
+if __name__ == '__main__':
+    sys.exit(main())
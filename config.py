@@ -0,0 +1,205 @@
+import json
+import os
+
+
+SETTINGS_PATH = 'arca_downloader_settings.json'
+
+
+def load_settings(path=SETTINGS_PATH):
+    with open(path, 'r') as f:
+        data = json.load(f)
+    upgrade_data(data)
+    verify_data(data)
+    return data
+
+
+def upgrade_data(data):
+    # filter keys added after a settings file was written get their default value
+    # returns True if anything was added
+    changed = False
+    for setting in [data.get('default')] + data.get('channels', []):
+        if type(setting) is not dict:
+            continue
+        for key, value in default_setting().items():
+            if key not in setting:
+                setting[key] = value
+                changed = True
+    return changed
+
+
+# writes the settings file with write-and-rename so a crash never leaves a truncated file
+# channel records are serialized once and reused until marked as changed
+class SettingsWriter:
+    def __init__(self, path=SETTINGS_PATH):
+        self.path = path
+        # id(record) -> (record, serialized record)
+        self.cache = {}
+        # pending after() job and log flag of coalesced save requests, used by the gui
+        self.job = None
+        self.log = False
+
+    def mark(self, changed=None):
+        # changed: channel records that were modified, None if anything could have changed
+        if changed is None:
+            self.cache.clear()
+            return
+        for record in changed:
+            self.cache.pop(id(record), None)
+
+    def dump(self, data):
+        parts = []
+        for key, value in data.items():
+            if key == 'channels':
+                records = [self.serialize(ch) for ch in value]
+                text = '[\n' + ',\n'.join(records) + '\n  ]' if records else '[]'
+            else:
+                text = json.dumps(value, indent=2).replace('\n', '\n  ')
+            parts.append(f'  {json.dumps(key)}: {text}')
+        return '{\n' + ',\n'.join(parts) + '\n}'
+
+    def serialize(self, record):
+        cached = self.cache.get(id(record))
+        if cached is None or cached[0] is not record:
+            cached = (record, '    ' + json.dumps(record, indent=2).replace('\n', '\n    '))
+            self.cache[id(record)] = cached
+        return cached[1]
+
+    def save(self, data):
+        text = self.dump(data)
+        temp_path = self.path + '.tmp'
+        try:
+            with open(temp_path, 'w') as f:
+                f.write(text)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temp_path, self.path)
+        except Exception:
+            # nothing written to the real file, cache stays valid for the retry
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+
+def create_default():
+    data = {
+        'default': default_setting(),
+        'channels': [],
+        'dl_mode': 3,
+        'dl_location': None,
+        'prev_ch': None,
+        'log_mode': 0,
+        'best': False,
+        'listing_workers': 4,
+        'article_workers': 2,
+        'article_queue': 32,
+        'media_workers': 4,
+        'media_queue': 32,
+        'chunk_size': 65536,
+        'disk_buffer': 33554432,
+        'disk_writers': 1,
+        'fsync': False,
+        'fsync_batch': 16,
+        'engine': 'thread',
+        'async_limit': 100,
+        'max_host_requests': 16,
+        'retries': 3,
+        'connect_timeout': 10,
+        'read_timeout': 60,
+        'cookies_file': None,
+        'bl_normalize': False,
+        'metrics_file': 'arca_downloader_metrics.jsonl',
+        'metrics_prom': None,
+        'parser': 'auto',
+        'parse_processes': 0,
+        'sync': False,
+        'sync_run': 5,
+        'dedup': False,
+        'verify_media': False,
+        'media_order': 'document',
+        'page_cache': True,
+        'page_cache_ttl': 300,
+        'log_lines': 5000,
+        'log_file': None
+    }
+    return data
+
+
+def verify_data(data):
+    def verify_settings(data, is_channel):
+        if type(data) is dict:
+            for key in default_setting():
+                if key not in data:
+                    raise Exception(f'no <{key}> in settings')
+            for key in (
+                    'title', 'content', 'upvote', 'downvote', 'combined', 'uploader', 'fav', 'category', 'size',
+                    'video', 'type'):
+                if type(data[key]) is not bool:
+                    raise Exception('not a boolean')
+            for key in (
+                    'combined_num', 'downvote_num', 'upvote_num', 'size_num', 'video_num', 'dl_count', 'prev_category',
+                    'filter'):
+                if type(data[key]) is not int:
+                    raise Exception('not an int')
+            for key in (
+                    'channel_category', 'category_bl', 'title_bl', 'content_bl', 'uploader_bl', 'type_bl', 'articles'):
+                if type(data[key]) is not list:
+                    raise Exception('not a list')
+        else:
+            raise Exception('data not a dict')
+        if is_channel:
+            if (type(data['channel_name']) is not str) or (type(data['channel_url']) is not str):
+                raise Exception('channel name or url corrupted')
+            elif len(data['channel_category']) == 0:
+                raise Exception('no channel category')
+            return
+        else:
+            return
+
+    verify_settings(data['default'], False)
+    for channel in data['channels']:
+        verify_settings(channel, True)
+    if type(data['dl_mode']) is not int:
+        raise Exception('dl_mode not int')
+    if type(data['log_mode']) is not int:
+        raise Exception('log_mode not int')
+    if type(data['best']) is not bool:
+        raise Exception('best not bool')
+    if 'dl_location' not in data:
+        raise Exception('dl_location not in data')
+    if 'prev_ch' not in data:
+        raise Exception('prev_ch not in data')
+
+
+def default_setting():
+    df_setting = {
+        'channel_name': None,
+        'channel_url': None,
+        'channel_category': [],
+        'prev_category': 0,
+        'filter': 0,
+        'dl_count': 0,
+        'fav': False,
+        'category': False,
+        'category_bl': [],
+        'title': False,
+        'title_bl': [],
+        'content': False,
+        'content_bl': [],
+        'upvote': False,
+        'upvote_num': 0,
+        'downvote': False,
+        'downvote_num': 0,
+        'combined': False,
+        'combined_num': 0,
+        'uploader': False,
+        'uploader_bl': [],
+        # media limits, sizes in MB, type_bl holds content type prefixes like video/ or image/gif
+        'size': False,
+        'size_num': 0,
+        'video': False,
+        'video_num': 0,
+        'type': False,
+        'type_bl': [],
+        'articles': []
+    }
+    return df_setting
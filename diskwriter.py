@@ -0,0 +1,162 @@
+import os
+import queue
+import threading
+import time
+
+
+def open_writer(gui, metrics=None):
+    data = gui.data
+    return DiskWriter(
+        data.get('disk_buffer', 33554432), data.get('disk_writers', 1), data.get('fsync', False),
+        data.get('fsync_batch', 16), metrics
+    )
+
+
+# media file writes run on writer threads so a slow disk never stalls the downloads
+# chunks wait in a queue limited by a byte budget, writes block only once the budget is used up
+# every file stays on one writer thread so its chunks are written in order
+class DiskWriter:
+    def __init__(self, budget=33554432, workers=1, fsync=False, fsync_batch=16, metrics=None):
+        # fsync: files are synced before they count as written, batch: files synced together
+        self.budget = budget
+        self.fsync = fsync
+        self.fsync_batch = fsync_batch
+        self.metrics = metrics
+        self.buffered = 0
+        self.space = threading.Condition()
+        self.queues = [queue.Queue() for _ in range(workers)]
+        self.next_queue = 0
+        self.lock = threading.Lock()
+        # totals for the throughput report
+        self.written = 0
+        self.busy = 0.0
+        self.threads = [threading.Thread(target=self.work, args=(q,), daemon=True) for q in self.queues]
+        for thread in self.threads:
+            thread.start()
+
+    def open(self, path, mode='wb'):
+        with self.lock:
+            q = self.queues[self.next_queue]
+            self.next_queue = (self.next_queue + 1) % len(self.queues)
+        handle = WriteHandle(self, q)
+        q.put((handle, 'open', (path, mode)))
+        return handle
+
+    def reserve(self, size, block=True):
+        # a chunk larger than the budget still goes through once the queue is empty
+        with self.space:
+            while self.buffered and self.buffered + size > self.budget:
+                if not block:
+                    return False
+                self.space.wait()
+            self.buffered += size
+            return True
+
+    def release(self, size):
+        with self.space:
+            self.buffered -= size
+            self.space.notify_all()
+
+    def work(self, q):
+        # files waiting for a batched fsync
+        unsynced = []
+        while True:
+            if unsynced and (q.empty() or len(unsynced) >= self.fsync_batch):
+                self.sync(unsynced)
+                unsynced = []
+            item = q.get()
+            if item is None:
+                self.sync(unsynced)
+                return
+            handle, op, arg = item
+            start = time.perf_counter()
+            try:
+                # after an error the rest of the file is dropped
+                if handle.error is None:
+                    if op == 'open':
+                        handle.file = open(*arg)
+                    elif op == 'write':
+                        handle.file.write(arg)
+                        handle.size += len(arg)
+                    else:
+                        handle.file.flush()
+            except Exception as expt:
+                handle.error = expt
+            if op == 'write':
+                self.release(len(arg))
+            handle.busy += time.perf_counter() - start
+            if op == 'close':
+                if self.fsync and handle.error is None:
+                    unsynced.append(handle)
+                else:
+                    self.finish(handle)
+
+    def sync(self, handles):
+        start = time.perf_counter()
+        for handle in handles:
+            try:
+                os.fsync(handle.file.fileno())
+            except OSError as expt:
+                handle.error = expt
+        # the batch shares the fsync time
+        elapsed = (time.perf_counter() - start) / len(handles) if handles else 0
+        for handle in handles:
+            handle.busy += elapsed
+            self.finish(handle)
+
+    def finish(self, handle):
+        if handle.file is not None:
+            try:
+                handle.file.close()
+            except OSError as expt:
+                handle.error = handle.error or expt
+        with self.lock:
+            self.written += handle.size
+            self.busy += handle.busy
+        if self.metrics:
+            self.metrics.observe('disk_write', handle.busy)
+            self.metrics.add('disk_bytes', handle.size)
+        handle.done.set()
+
+    def report(self, log):
+        with self.lock:
+            written, busy = self.written, self.busy
+        if written:
+            speed = written / busy / 1048576 if busy else 0
+            log(f'disk: {written / 1048576:.1f}MB written in {busy:.2f}s ({speed:.1f}MB/s)', essential=True)
+
+    def close(self):
+        for q in self.queues:
+            q.put(None)
+        for thread in self.threads:
+            thread.join()
+
+
+# one file being written by a DiskWriter
+class WriteHandle:
+    def __init__(self, writer, q):
+        self.writer = writer
+        self.queue = q
+        self.file = None
+        self.size = 0
+        self.busy = 0.0
+        self.error = None
+        self.done = threading.Event()
+
+    def write(self, chunk, block=True):
+        # returns False without queuing when block is False and the budget is used up
+        if self.error is not None:
+            raise self.error
+        if not self.writer.reserve(len(chunk), block):
+            return False
+        self.queue.put((self, 'write', chunk))
+        return True
+
+    def close(self):
+        self.queue.put((self, 'close', None))
+
+    def wait(self):
+        # blocks until the file is written and closed, raises the write error
+        self.done.wait()
+        if self.error is not None:
+            raise self.error
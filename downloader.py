@@ -1,176 +1,467 @@
-import requests
-import bs4
+import blobstore
+import blacklist
+import diskwriter
+import scraper
+import sessions
+import throttle
+import hashlib
+import mimetypes
+from pagecache import PageCache
+from metrics import Metrics
 import re
 import time
-import os.path
+import os
+import shutil
+import queue
 import threading
 import traceback
+from collections import deque, namedtuple
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor, wait as wait_futures
 
 
 NAME_RE = re.compile(r'/b/(\w+)/(\d+)')
 
 
 class Downloader(threading.Thread):
-    def __init__(self, gui, selected_ch, selected_cat, startpg: int, endpg: int, filter_mode: int, best: bool):
+    def __init__(
+            self, gui, selected_ch, selected_cat, startpg: int, endpg: int, filter_mode: int, best: bool, sync=False,
+            session=None
+    ):
+        # session: the process wide session unless a batch passes its own
         threading.Thread.__init__(self)
         self.gui = gui
-        self.s = requests.Session()
         self.selected_ch = selected_ch
         self.selected_cat = selected_cat
         self.startpg = startpg
         self.endpg = endpg
         self.filter_mode = filter_mode
         self.best = best
-        self.articles = set(selected_ch['articles'])
+        self.articles = gui.history.channel(selected_ch['channel_url'])
+        self.cache = gui.page_cache
+        # sync: page from startpg until a run of known articles, endpg is only a limit
+        self.sync = SyncState(gui, selected_ch, selected_cat, best) if sync else None
+        # pipeline stage settings
+        self.article_workers = gui.data.get('article_workers', 2)
+        self.article_queue = gui.data.get('article_queue', 32)
+        self.listing_workers = gui.data.get('listing_workers', 4)
+        media_workers = gui.data.get('media_workers', 4)
+        self.s = session or sessions.shared()
+        self.metrics = Metrics()
+        self.pool = MediaPool(
+            gui, self.s, media_workers, gui.data.get('media_queue', 32), gui.data.get('chunk_size', 65536),
+            blobstore.open_store(gui, gui.data['dl_location'] or '.'), self.metrics
+        )
+        # traceback of a failed article worker (stops the pipeline) or of the failed run
+        self.error = None
 
     def run(self):
         try:
             self.temp_download()
         except Exception:
+            self.error = traceback.format_exc()
             self.gui.log('failed download:', essential=True)
-            self.gui.log(traceback.format_exc(), essential=True)
+            self.gui.log(self.error, essential=True)
+        finally:
+            self.pool.close()
+            save_metrics(self.gui, self.metrics, self.selected_ch, self.selected_cat, 'thread', self.result())
         self.gui.root.event_generate('<<DownloadComplete>>')
 
+    def result(self):
+        return {'saved': self.pool.saved, 'failed': len(self.pool.failures), 'error': self.error}
+
     def temp_download(self):
         s = time.perf_counter()
         # set filter
-        if self.filter_mode == 0:
-            _filter = {}
-        elif self.filter_mode == 1:
-            _filter = self.gui.data['default']
-        else:
-            _filter = self.selected_ch
+        _filter = select_filter(self.gui.data, self.selected_ch, self.filter_mode)
 
         ch_url, cat_url = self.selected_ch['channel_url'], self.selected_cat[0]
+        dl_path = prepare_download(self.gui, self.selected_ch, self.selected_cat, self.startpg, self.endpg)
 
-        # configure download location
-        dl_path = build_dl_path(
-            self.gui.data['dl_mode'],
-            self.gui.data['dl_location'],
-            self.selected_ch['channel_name'],
-            self.selected_cat[1]
-        )
-        if not os.path.exists(dl_path):
-            os.makedirs(dl_path)
+        # finish media of articles an interrupted run left behind
+        pending = self.gui.history.pending(ch_url)
+        if pending:
+            self.gui.log(f'resuming {len(pending)} unfinished articles', essential=True)
+        for article_id, items in pending.items():
+            self.pool.queue(items, (ch_url, article_id), resume=True)
 
-        # log
-        self.gui.log(
-            '\n--------------new download--------------\n',
-            f'channel: {self.selected_ch["channel_name"]}\ncategory: {self.selected_cat[1]}',
-            f'page: {self.startpg}-{self.endpg}',
-            '\n----------begin page download-----------\n',
-            sep='\n', essential=True
-        )
-
-        # page download
-        article_list = []
-        for page in range(self.startpg, self.endpg + 1):
-            # check if stop
-            if self.gui.destroy:
-                raise Exception('thread stopped')
-            self.gui.log(f'requesting page {page}')
-            url = build_url(ch_url, cat_url, page, best=self.best)
-            self.page_scrape(url, _filter, article_list)
+        # pipeline: listing fetch (listing workers) -> filter (this thread) -> article queue -> article workers
+        # -> media pool
+        article_queue = queue.Queue(maxsize=self.article_queue)
+        workers = [
+            threading.Thread(target=self.article_worker, args=(article_queue, _filter, dl_path), daemon=True)
+            for _ in range(self.article_workers)
+        ]
+        for worker in workers:
+            worker.start()
+        listings = self.listings(ch_url, cat_url)
+        try:
+            # rows move down while paging, an article can show up again on the next page
+            # resumed articles are already queued, fetching them again would download their media twice
+            seen = set(pending)
+            for rows in listings:
+                # check if stop
+                if self.gui.destroy:
+                    raise Exception('thread stopped')
+                if self.error:
+                    break
+                rows = dedup_rows(rows, seen)
+                self.page_scrape(rows, _filter, article_queue)
+                if self.sync and self.sync.scan(rows, self.articles):
+                    break
+        finally:
+            listings.close()
+            # workers exit after draining the queue
+            for _ in workers:
+                article_queue.put(None)
+            for worker in workers:
+                worker.join()
+        if self.error:
+            raise Exception('article download failed:\n' + self.error)
 
-        self.gui.log('\n---------begin article download---------', essential=True)
-        # article download
-        for article_url in article_list:
-            if self.gui.destroy:
-                raise Exception('thread stopped')
-            self.get_article('https://arca.live' + article_url, _filter, dl_path)
+        # wait for queued media
+        self.pool.wait()
+        if self.sync:
+            self.sync.commit()
         e = time.perf_counter()
         self.gui.log(f'\ndownload complete in {e - s}s\n', essential=True)
 
-    def page_scrape(self, url, settings: dict, output_list):
-        r = self.s.get(url, cookies={'allow_sensitive_media': 'true'})
-        soup = bs4.BeautifulSoup(r.text, 'html.parser')
-        for tag in soup.select('[class=vrow]'):
-            title = tag.select_one('.title').getText()
-            self.gui.log(f'\nanalyzing: {title}')
-
-            # duplicate article check
-            article_url = tag['href']
-            match = NAME_RE.search(article_url)
-            if not match:
-                self.gui.log('WARNING: failed to match url regex on url: ' + article_url, essential=True)
-            elif match.group(2) in self.articles:
-                self.gui.log('skip: previously downloaded')
+    def article_worker(self, article_queue, settings: dict, dl_path):
+        while True:
+            article_url = article_queue.get()
+            if article_url is None:
+                return
+            # keep draining so the scraper never blocks on a full queue
+            if self.gui.destroy or self.error:
                 continue
+            try:
+                self.get_article('https://arca.live' + article_url, settings, dl_path)
+            except Exception:
+                self.error = traceback.format_exc()
 
-            if not tag.select_one('.vrow-preview'):
-                self.gui.log('skip: no image')
-                continue
-            if settings.get('combined'):
-                combined = int(tag.select_one('.col-rate').getText())
-                if combined < settings['combined_num']:
-                    self.gui.log(f'skip: combined votes {combined} < {settings["combined_num"]}')
-                    continue
-            if settings.get('title'):
-                match = False
-                for word in settings['title_bl']:
-                    if word in title:
-                        match = True
-                        break
-                if match:
-                    self.gui.log(f'skip: {word} in title: {title}')
-                    continue
-            if settings.get('category'):
-                category = tag.select_one('.badge').get_text()
-                if category in settings['category_bl']:
-                    self.gui.log(f'skip: category {category}')
-                    continue
-            if settings.get('uploader'):
-                # not yet implemented
-                self.gui.log(str(tag.select_one('.user-info')))
-            # if True:
-            #     print(tag.select_one('time')['datetime'])
-            self.gui.log('appending to queue')
-            output_list.append(article_url)
+    def listings(self, ch_url, cat_url):
+        # yields the rows of each page in page order, up to listing_workers pages are fetched ahead
+        # closing the generator cancels the pages not started yet
+        pages = iter(range(self.startpg, self.endpg + 1))
+        ahead = deque()
+        executor = ThreadPoolExecutor(max_workers=self.listing_workers)
+        # a sync run usually stops within the first pages, it starts with one page
+        # and looks further ahead after each page that didn't reach the synced articles
+        depth = 1 if self.sync else self.listing_workers
+
+        def fill():
+            for page in pages:
+                self.gui.log(f'requesting page {page}')
+                url = build_url(ch_url, cat_url, page, best=self.best)
+                ahead.append(executor.submit(self.get_rows, url))
+                if len(ahead) >= depth:
+                    return
+
+        try:
+            fill()
+            while ahead:
+                future = ahead.popleft()
+                if not self.sync:
+                    fill()
+                yield future.result()
+                if self.sync:
+                    depth = min(depth * 2, self.listing_workers)
+                    fill()
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    def page_scrape(self, rows, settings: dict, output_queue):
+        with self.metrics.time('listing_filter'):
+            article_urls = filter_rows(rows, settings, self.articles, self.gui.log, self.metrics)
+        for article_url in article_urls:
+            output_queue.put(article_url)
+
+    def get_rows(self, url):
+        entry = self.cache.lookup(url) if self.cache else None
+        if entry and self.cache.fresh(entry):
+            self.gui.log('page cached')
+            self.metrics.add('page_cached')
+            return self.cache.rows(entry)
+        with self.metrics.time('listing_fetch'):
+            r = throttle.get(
+                self.s, url, cookies={'allow_sensitive_media': 'true'}, headers=PageCache.request_headers(entry)
+            )
+        if entry and r.status_code == 304:
+            self.gui.log('page not modified')
+            self.metrics.add('page_not_modified')
+            self.cache.touch(url)
+            return self.cache.rows(entry)
+        throttle.check_page(r.status_code)
+        self.metrics.add('listing_bytes', len(r.content))
+        with self.metrics.time('listing_parse'):
+            rows = scraper.parse(scraper.parse_listing, r.text)
+        if self.cache:
+            self.cache.store(url, r.headers, rows)
+        return rows
 
     def get_article(self, article_url, settings: dict, dl_path):
         self.gui.log('getting article:', article_url)
-        r = self.s.get(article_url)
-        soup = bs4.BeautifulSoup(r.text, 'html.parser')
-        head = soup.select_one('head title').get_text()
-        self.gui.log(f'\narticle: {head}')
-        if '⚠️ 제한된 콘텐츠' == head:
-            raise Exception('version update needed: ⚠️ 제한된 콘텐츠')
-        if settings.get('content'):
-            content = soup.select_one('.article-content').get_text()
-            for string in settings['content_bl']:
-                if string in content:
-                    self.gui.log(f'skip: {string} in contents')
+        # stop keeping the page at the comments, the filters only need the article itself
+        start = time.perf_counter()
+        try:
+            with throttle.get(self.s, article_url, stream=True) as r:
+                if r.status_code in throttle.SKIP_STATUS:
+                    # deleted or hidden articles do not stop the run
+                    self.gui.log(f'skipped: http status {r.status_code}', essential=True)
+                    self.metrics.skip('http_status')
                     return
-        if settings.get('upvote'):
-            upvote = int(soup.select_one('.article-info .body:nth-child(2)').get_text())
-            if upvote < settings['upvote_num']:
-                self.gui.log(f'skip: upvote {upvote} < {settings["upvote_num"]}')
-                return
-        if settings.get('downvote'):
-            downvote = int(soup.select_one('.article-info .body:nth-child(5)').get_text())
-            if downvote > settings['downvote_num']:
-                self.gui.log(f'skip: downvote {downvote} > {settings["downvote_num"]}')
-                return
-        src_list = []
-        for img in soup.select('.article-content img'):
-            img_url = img.get('src')
-            src_list.append(img_url if img_url.startswith('https:') else 'https:' + img_url)
-        for video in soup.select('.article-content video'):
-            vid_url = video.get('src')
-            src_list.append(vid_url if vid_url.startswith('https:') else 'https:' + vid_url)
+                throttle.check_page(r.status_code)
+                reader = scraper.ArticleReader(scraper.body_length(r.headers))
+                for chunk in r.iter_content(scraper.ARTICLE_CHUNK):
+                    if reader.feed(chunk):
+                        break
+                text = reader.text(r.encoding)
+        except Exception as expt:
+            # neither does one that is still throttled or unreachable after the retries
+            if not throttle.transient(expt):
+                raise
+            self.gui.log(f'skipped: {article_url} ({expt})', essential=True)
+            self.metrics.skip('http_error')
+            return
+        self.metrics.observe('article_fetch', time.perf_counter() - start)
+        self.metrics.add('article_bytes', reader.size)
+        with self.metrics.time('article_parse'):
+            article = scraper.parse(scraper.parse_article, text)
+        with self.metrics.time('article_filter'):
+            src_list = filter_article(article, settings, self.gui.log, self.metrics)
+        if src_list is None:
+            return
         match = NAME_RE.search(article_url)
         # Does not add article number if not matched
         prefix = None
+        article = None
         if match:
             prefix = f'{match.group(1)}-{match.group(2)}-'
-            self.gui.article_list.append(match.group(2))
-        for i, src in enumerate(src_list):
+            article = (self.selected_ch['channel_url'], match.group(2))
+        for src in src_list:
             self.gui.log(f'downloading: {src}')
-            r = self.s.get(src)
-            ext = os.path.splitext(src)[1]
-            filename = prefix + str(i) + ext if prefix else os.path.basename(src)
-            with open(dl_path + filename, 'wb') as f:
-                f.write(r.content)
+        self.pool.download(src_list, prefix, dl_path, article, settings)
+
+
+def dedup_rows(rows, seen):
+    # drops rows of articles already in seen (article ids), adds the rest
+    output_rows = []
+    for row in rows:
+        match = NAME_RE.search(row['url'])
+        if match:
+            if match.group(2) in seen:
+                continue
+            seen.add(match.group(2))
+        output_rows.append(row)
+    return output_rows
+
+
+# filters are shared by every download engine and only see parsed records
+def count_skip(metrics, reason):
+    if metrics:
+        metrics.skip(reason)
+
+
+def filter_rows(rows, settings: dict, articles, log, metrics=None):
+    # returns urls of listing rows that pass the filter
+    output_list = []
+    for row in rows:
+        title = row['title']
+        log(f'\nanalyzing: {title}')
+
+        # duplicate article check
+        article_url = row['url']
+        match = NAME_RE.search(article_url)
+        if not match:
+            log('WARNING: failed to match url regex on url: ' + article_url, essential=True)
+        elif match.group(2) in articles:
+            log('skip: previously downloaded')
+            count_skip(metrics, 'downloaded')
+            continue
+
+        if not row['preview']:
+            log('skip: no image')
+            count_skip(metrics, 'no_image')
+            continue
+        if settings.get('combined'):
+            combined = int(row['rate'])
+            if combined < settings['combined_num']:
+                log(f'skip: combined votes {combined} < {settings["combined_num"]}')
+                count_skip(metrics, 'combined')
+                continue
+        if settings.get('title'):
+            word = settings['title_match'].search(title)
+            if word is not None:
+                log(f'skip: {word} in title: {title}')
+                count_skip(metrics, 'title')
+                continue
+        if settings.get('category'):
+            category = row['badge']
+            if category in settings['category_bl']:
+                log(f'skip: category {category}')
+                count_skip(metrics, 'category')
+                continue
+        if settings.get('uploader'):
+            # not yet implemented
+            log(str(row['user_info']))
+        log('appending to queue')
+        output_list.append(article_url)
+    return output_list
+
+
+def filter_article(article, settings: dict, log, metrics=None):
+    # returns media srcs of the article, None if filtered
+    head = article['head']
+    log(f'\narticle: {head}')
+    if '⚠️ 제한된 콘텐츠' == head:
+        raise Exception('version update needed: ⚠️ 제한된 콘텐츠')
+    if settings.get('content'):
+        string = settings['content_match'].search(article['content'])
+        if string is not None:
+            log(f'skip: {string} in contents')
+            count_skip(metrics, 'content')
+            return None
+    if settings.get('upvote'):
+        upvote = int(article['upvote'])
+        if upvote < settings['upvote_num']:
+            log(f'skip: upvote {upvote} < {settings["upvote_num"]}')
+            count_skip(metrics, 'upvote')
+            return None
+    if settings.get('downvote'):
+        downvote = int(article['downvote'])
+        if downvote > settings['downvote_num']:
+            log(f'skip: downvote {downvote} > {settings["downvote_num"]}')
+            count_skip(metrics, 'downvote')
+            return None
+    return article['srcs']
+
+
+# incremental sync state of one listing (channel, category, best)
+# rows at or below the previous high-water mark count as known, as do downloaded articles
+class SyncState:
+    def __init__(self, gui, selected_ch, selected_cat, best):
+        self.gui = gui
+        self.key = (selected_ch['channel_url'], selected_cat[0], best)
+        self.mark = gui.history.get_mark(*self.key)
+        self.top = self.mark
+        # consecutive known rows needed to stop paging
+        self.run = gui.data.get('sync_run', 5)
+        self.known = 0
+
+    def scan(self, rows, articles):
+        # returns True once the listing reached previously synced articles
+        for row in rows:
+            match = NAME_RE.search(row['url'])
+            if not match:
+                self.known = 0
+                continue
+            article_id = int(match.group(2))
+            self.top = max(self.top, article_id)
+            if article_id <= self.mark or match.group(2) in articles:
+                self.known += 1
+            else:
+                self.known = 0
+        if self.known >= self.run:
+            self.gui.log(f'sync: reached {self.known} known articles, stop paging', essential=True)
+            return True
+        return False
+
+    def commit(self):
+        if self.top > self.mark:
+            self.gui.history.set_mark(*self.key, self.top)
+
+
+def probe_needed(settings, order):
+    # media is probed with HEAD requests only for size or type filters and size based ordering
+    settings = settings or {}
+    return order != 'document' or any(settings.get(key) for key in ('size', 'video', 'type'))
+
+
+def media_probe(src, length, content_type):
+    # content type is guessed from the extension when the server does not send one
+    size = int(length) if length and length.isdigit() else None
+    if content_type:
+        content_type = content_type.split(';')[0].strip().lower()
+    else:
+        content_type = mimetypes.guess_type(src.split('?')[0])[0]
+    return size, content_type
+
+
+def select_media(items, probes, settings, order, log, metrics=None):
+    # returns the (src, path) items that pass the size and type filters, in download order
+    # order: 'document', 'small_first' or 'large_first', media of unknown size goes last
+    settings = settings or {}
+    selected = []
+    for item, (size, content_type) in zip(items, probes):
+        src = item[0]
+        if settings.get('type') and content_type and any(
+                content_type.startswith(prefix) for prefix in settings['type_bl']):
+            log(f'skip: type {content_type}: {src}')
+            count_skip(metrics, 'media_type')
+            continue
+        if size is not None and settings.get('size') and size > settings['size_num'] * 1048576:
+            log(f'skip: size {size / 1048576:.1f}MB > {settings["size_num"]}MB: {src}')
+            count_skip(metrics, 'media_size')
+            continue
+        if (size is not None and settings.get('video') and content_type and content_type.startswith('video/')
+                and size > settings['video_num'] * 1048576):
+            log(f'skip: video {size / 1048576:.1f}MB > {settings["video_num"]}MB: {src}')
+            count_skip(metrics, 'media_size')
+            continue
+        selected.append((item, size))
+    if order == 'small_first':
+        selected.sort(key=lambda x: (x[1] is None, x[1] or 0))
+    elif order == 'large_first':
+        selected.sort(key=lambda x: (x[1] is None, -(x[1] or 0)))
+    return [item for item, _ in selected]
+
+
+def media_filename(prefix, i, src):
+    ext = os.path.splitext(src)[1]
+    return prefix + str(i) + ext if prefix else os.path.basename(src)
+
+
+def prepare_download(gui, selected_ch, selected_cat, startpg, endpg):
+    # configure download location
+    dl_path = build_dl_path(gui.data['dl_mode'], gui.data['dl_location'], selected_ch['channel_name'], selected_cat[1])
+    if not os.path.exists(dl_path):
+        os.makedirs(dl_path)
+
+    # log
+    gui.log(
+        '\n--------------new download--------------\n',
+        f'channel: {selected_ch["channel_name"]}\ncategory: {selected_cat[1]}',
+        f'page: {startpg}-{endpg}',
+        '\n----------begin page download-----------\n',
+        sep='\n', essential=True
+    )
+    return dl_path
+
+
+def select_filter(data, selected_ch, filter_mode):
+    if filter_mode == 0:
+        settings = {}
+    elif filter_mode == 1:
+        settings = data['default']
+    else:
+        settings = selected_ch
+    # blacklists are compiled once per run, on a copy so they never reach the settings file
+    settings = dict(settings)
+    normalize = data.get('bl_normalize', False)
+    settings['title_match'] = blacklist.Blacklist(settings.get('title_bl', ()), normalize)
+    settings['content_match'] = blacklist.Blacklist(settings.get('content_bl', ()), normalize)
+    return settings
+
+
+def save_metrics(gui, metrics, selected_ch, selected_cat, engine, result):
+    # a run never fails because its metrics could not be written
+    try:
+        metrics.save(
+            gui.data, {'channel': selected_ch['channel_name']},
+            channel=selected_ch['channel_name'], category=selected_cat[1], engine=engine, **result
+        )
+    except OSError as expt:
+        gui.log(f'could not write metrics: {expt}', essential=True)
 
 
 def build_dl_path(mode, user_path, ch_name, cat_name):
@@ -197,11 +488,16 @@ def build_url(ch_url, category_url, page, best=False):
 
 # Page downloader does not add article to downloaded articles
 class PageDownloader(threading.Thread):
-    def __init__(self, gui, url):
+    def __init__(self, gui, url, session=None):
         threading.Thread.__init__(self)
         self.gui = gui
-        self.s = requests.Session()
+        media_workers = gui.data.get('media_workers', 4)
+        self.s = session or sessions.shared()
         self.url = url
+        self.pool = MediaPool(
+            gui, self.s, media_workers, gui.data.get('media_queue', 32), gui.data.get('chunk_size', 65536),
+            blobstore.open_store(gui, './arca_downloaded')
+        )
 
     def run(self):
         try:
@@ -209,6 +505,8 @@ class PageDownloader(threading.Thread):
         except Exception:
             self.gui.log('failed download:', essential=True)
             self.gui.log(traceback.format_exc(), essential=True)
+        finally:
+            self.pool.close()
 
     def page_download(self):
         # dl path
@@ -217,40 +515,232 @@ class PageDownloader(threading.Thread):
             os.makedirs(dl_path)
 
         self.gui.log('\ngetting article:', self.url, essential=True)
-        r = self.s.get(self.url)
-        soup = bs4.BeautifulSoup(r.text, 'html.parser')
-        head = soup.select_one('head title').get_text()
-        self.gui.log(f'article: {head}\n')
-        if '⚠️ 제한된 콘텐츠' == head:
-            raise Exception('version update needed: ⚠️ 제한된 콘텐츠')
-        src_list = []
-        for img in soup.select('.article-content img'):
-            img_url = img.get('src')
-            src_list.append(img_url if img_url.startswith('https:') else 'https:' + img_url)
-        for video in soup.select('.article-content video'):
-            vid_url = video.get('src')
-            src_list.append(vid_url if vid_url.startswith('https:') else 'https:' + vid_url)
+        r = throttle.get(self.s, self.url)
+        throttle.check_page(r.status_code)
+        src_list = filter_article(scraper.parse_article(r.text), {}, self.gui.log)
         # filename prefix
         match = NAME_RE.search(self.url)
         prefix = f'{match.group(1)}-{match.group(2)}-' if match else None
-        for i, src in enumerate(src_list):
+        for src in src_list:
             self.gui.log(f'downloading: {src}')
-            r = self.s.get(src)
-            ext = os.path.splitext(src)[1]
-            filename = prefix + str(i) + ext if prefix else os.path.basename(src)
-            with open(dl_path + filename, 'wb') as f:
-                f.write(r.content)
+        self.pool.download(src_list, prefix, dl_path)
+        self.pool.wait()
         self.gui.log('\ndownload complete', essential=True)
 
 
+MediaResult = namedtuple('MediaResult', ['src', 'path', 'error'])
+
+
+# media download worker pool, media from several articles can be queued before waiting
+# download() blocks once max_queued files are pending so producers can't run ahead
+# media of an article (channel url, article id) is journaled, the article enters the history once all of it is saved
+# with a blob store, media is hashed while streaming and saved once per content
+class MediaPool:
+    def __init__(self, gui, session, workers=4, max_queued=32, chunk_size=65536, blobs=None, metrics=None):
+        self.gui = gui
+        self.s = session
+        self.chunk_size = chunk_size
+        self.blobs = blobs
+        self.metrics = metrics or Metrics()
+        self.writer = diskwriter.open_writer(gui, self.metrics)
+        # check the size of indexed media with a HEAD request before reusing it
+        self.verify_media = gui.data.get('verify_media', False)
+        self.order = gui.data.get('media_order', 'document')
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        # HEAD probes get their own threads, behind queued downloads they would stall the article workers
+        self.probes = ThreadPoolExecutor(max_workers=min(workers, 4))
+        self.slots = threading.Semaphore(max(max_queued, workers))
+        self.lock = threading.Lock()
+        self.pending = set()
+        self.saved = 0
+        self.failures = []
+
+    def download(self, src_list, prefix, dl_path, article=None, settings=None):
+        # settings: filter of the run, media size and type limits apply when probing
+        items = [(src, dl_path + media_filename(prefix, i, src)) for i, src in enumerate(src_list)]
+        if probe_needed(settings, self.order):
+            probes = list(self.probes.map(self.probe, [src for src, _ in items]))
+            items = select_media(items, probes, settings, self.order, self.gui.log, self.metrics)
+        if article:
+            self.gui.history.begin(*article, items)
+        self.queue(items, article)
+
+    def queue(self, items, article=None, resume=False):
+        for src, path in items:
+            while not self.slots.acquire(timeout=0.5):
+                if self.gui.destroy:
+                    raise Exception('thread stopped')
+            future = self.executor.submit(self.fetch, src, path, resume)
+            with self.lock:
+                self.pending.add(future)
+            future.add_done_callback(partial(self.fetched, article))
+
+    def fetch(self, src, path, resume=False):
+        # stream to a temp file and rename on success, partial files never get the final name
+        # a temp file left by an interrupted run is continued with a range request
+        temp_path = path + '.part'
+        if resume and os.path.exists(path):
+            return MediaResult(src, path, None)
+        try:
+            saved = indexed_media(self.gui.history, src)
+            if saved and self.verify_media and not self.same_size(src, saved[1]):
+                saved = None
+            if saved:
+                reuse_media(saved[0], path)
+                self.gui.log(f'already downloaded: {src}')
+                self.metrics.add('media_indexed')
+                self.metrics.add('media_indexed_bytes', saved[1])
+                return MediaResult(src, path, None)
+            offset = os.path.getsize(temp_path) if os.path.exists(temp_path) else 0
+            headers = {'Range': f'bytes={offset}-'} if offset else {}
+            start = time.perf_counter()
+            with throttle.get(self.s, src, stream=True, headers=headers) as r:
+                self.metrics.observe('media_ttfb', time.perf_counter() - start)
+                if r.status_code == 416:
+                    # stale temp file, start over next time
+                    os.remove(temp_path)
+                    raise Exception('range not satisfiable')
+                throttle.check_media(r.status_code, r.headers.get('Content-Type'))
+                # servers without range support send the whole file again
+                mode = 'ab' if offset and r.status_code == 206 else 'wb'
+                digest = start_digest(temp_path if mode == 'ab' else None) if self.blobs else None
+                start = time.perf_counter()
+                size = 0
+                # the writer thread writes while the next chunks arrive
+                handle = self.writer.open(temp_path, mode)
+                try:
+                    for chunk in r.iter_content(self.chunk_size):
+                        if self.gui.destroy:
+                            raise Exception('thread stopped')
+                        handle.write(chunk)
+                        size += len(chunk)
+                        if digest:
+                            digest.update(chunk)
+                finally:
+                    handle.close()
+                self.metrics.observe('media_transfer', time.perf_counter() - start)
+                self.metrics.add('media_bytes', size)
+            handle.wait()
+            if digest:
+                self.blobs.store(temp_path, path, digest.hexdigest())
+            else:
+                os.replace(temp_path, path)
+            index_media(self.gui.history, src, path, digest)
+        except Exception as expt:
+            # the temp file is kept for the next run
+            return MediaResult(src, path, expt)
+        return MediaResult(src, path, None)
+
+    def probe(self, src):
+        # (size, content type) from a HEAD request, None for what the server does not tell
+        try:
+            r = throttle.head(self.s, src)
+            r.close()
+        except OSError:
+            return None, None
+        if r.status_code >= 400:
+            return None, None
+        return media_probe(src, r.headers.get('Content-Length'), r.headers.get('Content-Type'))
+
+    def same_size(self, src, size):
+        # False if the server reports a different size, unknown sizes count as the same
+        try:
+            r = throttle.head(self.s, src)
+            r.close()
+        except OSError:
+            return True
+        length = r.headers.get('Content-Length')
+        return r.status_code >= 400 or not length or int(length) == size
+
+    def fetched(self, article, future):
+        with self.lock:
+            self.pending.discard(future)
+        self.slots.release()
+        if future.cancelled():
+            return
+        result = future.result()
+        if result.error is None:
+            with self.lock:
+                self.saved += 1
+            self.gui.log(f'saved: {result.path}')
+            if article and self.gui.history.media_done(*article, result.src):
+                self.gui.log(f'article complete: {article[1]}')
+        else:
+            with self.lock:
+                self.failures.append(result)
+            self.metrics.add('media_failed')
+            self.gui.log(f'failed: {result.src} ({result.error})', essential=True)
+            if article and throttle.gone(result.error):
+                # removed from the server, retrying in later runs can't help
+                self.gui.log(f'giving up: {result.src}', essential=True)
+                if self.gui.history.media_done(*article, result.src):
+                    self.gui.log(f'article complete: {article[1]}')
+
+    def wait(self):
+        # blocks until every queued file is done, returns (saved, failed) count
+        while True:
+            with self.lock:
+                pending = list(self.pending)
+            if not pending:
+                break
+            wait_futures(pending, timeout=0.5)
+            if self.gui.destroy:
+                raise Exception('thread stopped')
+        self.gui.log(f'\nmedia: {self.saved} saved, {len(self.failures)} failed', essential=True)
+        self.writer.report(self.gui.log)
+        if self.blobs:
+            self.blobs.report(self.gui.log)
+        return self.saved, len(self.failures)
+
+    def close(self):
+        self.probes.shutdown(wait=True, cancel_futures=True)
+        self.executor.shutdown(wait=True, cancel_futures=True)
+        self.writer.close()
+
+
+def indexed_media(history, src):
+    # (path, size) of an earlier download of src that is still on disk, None otherwise
+    entry = history.media_entry(src)
+    if entry is None:
+        return None
+    path, size, _ = entry
+    if not os.path.exists(path) or os.path.getsize(path) != size:
+        return None
+    return path, size
+
+
+def reuse_media(saved_path, path):
+    # links or copies an earlier download to path
+    if os.path.abspath(saved_path) == os.path.abspath(path):
+        return
+    if os.path.exists(path):
+        os.remove(path)
+    try:
+        os.link(saved_path, path)
+    except OSError:
+        shutil.copyfile(saved_path, path)
+
+
+def index_media(history, src, path, digest=None):
+    history.add_media(src, os.path.abspath(path), os.path.getsize(path), digest.hexdigest() if digest else None)
+
+
+def start_digest(part_path=None):
+    # sha256 of media, continued from the bytes of a resumed temp file
+    digest = hashlib.sha256()
+    if part_path:
+        with open(part_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1048576), b''):
+                digest.update(chunk)
+    return digest
+
+
 def ch_register(ch_url, ch_data):
-    r = requests.get(ch_url)
+    r = throttle.get(sessions.shared(), ch_url)
     r.raise_for_status()
-    soup = bs4.BeautifulSoup(r.text, 'html.parser')
-    ch_data['channel_name'] = soup.select_one('.board-title > a:last-of-type').get_text()
+    ch_data['channel_name'], categories = scraper.parse_channel(r.text)
     if not ch_data['channel_name']:
         raise Exception('no channel name found')
-    for tag in soup.select('.board-category a'):
-        ch_data['channel_category'].append([tag['href'], tag.get_text()])
+    ch_data['channel_category'].extend(categories)
     ch_data['channel_url'] = ch_url
     return ch_data
@@ -0,0 +1,102 @@
+import sys
+import config
+import history
+import pagecache
+import scraper
+import sessions
+import throttle
+import downloader
+
+
+FILTER_MODES = {'none': 0, 'default': 1, 'channel': 2}
+
+
+# stands in for main.GUI so the download engines run without tkinter
+# provides the settings, history, log and stop flag the engines use
+class Context:
+    def __init__(self, settings_path=config.SETTINGS_PATH, history_path=history.HISTORY_PATH, verbose=False):
+        self.data = config.load_settings(settings_path)
+        self.writer = config.SettingsWriter(settings_path)
+        self.history = history.ArticleHistory(history_path)
+        if self.history.migrate(self.data):
+            self.writer.save(self.data)
+        scraper.set_backend(self.data.get('parser', 'auto'))
+        scraper.set_processes(self.data.get('parse_processes', 0))
+        throttle.configure(self.data.get('max_host_requests', 16), self.data.get('retries', 3))
+        sessions.configure(
+            self.data.get('max_host_requests', 16),
+            (self.data.get('connect_timeout', 10), self.data.get('read_timeout', 60)), self.data.get('cookies_file')
+        )
+        self.page_cache = None
+        if self.data.get('page_cache', True):
+            self.page_cache = pagecache.PageCache(ttl=self.data.get('page_cache_ttl', 300))
+        self.verbose = verbose
+        self.destroy = False
+        # engines signal completion with root.event_generate
+        self.root = self
+
+    def event_generate(self, sequence):
+        pass
+
+    def log(self, *args: str, sep=' ', end='\n', essential=False):
+        if self.verbose or essential:
+            sys.stderr.write(sep.join(args) + end)
+
+    def find_channel(self, name):
+        # by channel name or url
+        for ch in self.data['channels']:
+            if name in (ch['channel_name'], ch['channel_url']):
+                return ch
+        raise ValueError(f'channel not registered: {name}')
+
+    def close(self):
+        sessions.close()
+        scraper.close()
+        self.history.close()
+        if self.page_cache:
+            self.page_cache.close()
+
+
+def find_category(ch, name=None):
+    # by category name, the first category (all articles) if None
+    if name is None:
+        return ch['channel_category'][0]
+    for cat in ch['channel_category']:
+        if cat[1] == name:
+            return cat
+    raise ValueError(f'category not found in {ch["channel_name"]}: {name}')
+
+
+def download(context, channel, category=None, startpg=1, endpg=1, filter_mode=None, best=False, sync=False,
+             engine='thread', session=None):
+    # runs one download to completion on the calling thread, returns the engine result
+    # session: requests session shared with other jobs, thread engine only
+    ch = context.find_channel(channel)
+    cat = find_category(ch, category)
+    if filter_mode is None:
+        filter_mode = ch['filter']
+    elif isinstance(filter_mode, str):
+        filter_mode = FILTER_MODES[filter_mode]
+    startpg, endpg = sorted((startpg, endpg))
+    if sync:
+        startpg = 1
+    if engine == 'thread':
+        job = downloader.Downloader(context, ch, cat, startpg, endpg, filter_mode, best, sync, session)
+    elif engine == 'async':
+        # aiohttp is a large part of the startup, thread engine runs skip it
+        import aio_downloader
+        job = aio_downloader.AsyncDownloader(context, ch, cat, startpg, endpg, filter_mode, best, sync)
+    else:
+        raise ValueError(f'unknown engine: {engine}')
+    job.start()
+    try:
+        while job.is_alive():
+            job.join(0.5)
+    except KeyboardInterrupt:
+        # same stop signal the gui uses on window close
+        context.destroy = True
+        job.join()
+        raise
+    result = job.result()
+    result.update(channel=ch['channel_name'], category=cat[1], pages=[startpg, endpg])
+    return result
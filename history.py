@@ -0,0 +1,171 @@
+import sqlite3
+import threading
+
+
+HISTORY_PATH = 'arca_downloader_history.db'
+
+
+# downloaded article ids, keyed by channel url
+# replaces the 'articles' list of each channel in the settings file
+class ArticleHistory:
+    def __init__(self, path=HISTORY_PATH):
+        # shared by the gui and downloader threads, access is serialized by the lock
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.lock = threading.Lock()
+        with self.lock, self.conn:
+            self.conn.execute(
+                'CREATE TABLE IF NOT EXISTS articles ('
+                'channel TEXT NOT NULL, article_id TEXT NOT NULL, PRIMARY KEY (channel, article_id)'
+                ') WITHOUT ROWID'
+            )
+            # run journal: media of articles that are not complete yet
+            self.conn.execute(
+                'CREATE TABLE IF NOT EXISTS journal ('
+                'channel TEXT NOT NULL, article_id TEXT NOT NULL, src TEXT NOT NULL, path TEXT NOT NULL, '
+                'done INTEGER NOT NULL DEFAULT 0, PRIMARY KEY (channel, article_id, src)'
+                ') WITHOUT ROWID'
+            )
+            # deduplicated media blobs and how many file names link to them
+            self.conn.execute(
+                'CREATE TABLE IF NOT EXISTS blobs ('
+                'digest TEXT PRIMARY KEY, size INTEGER NOT NULL, links INTEGER NOT NULL'
+                ') WITHOUT ROWID'
+            )
+            # highest article id seen by a sync, per listing
+            self.conn.execute(
+                'CREATE TABLE IF NOT EXISTS marks ('
+                'channel TEXT NOT NULL, category TEXT NOT NULL, best INTEGER NOT NULL, article_id INTEGER NOT NULL, '
+                'PRIMARY KEY (channel, category, best)'
+                ') WITHOUT ROWID'
+            )
+            # saved media by source url, lets later runs reuse the file instead of downloading it again
+            self.conn.execute(
+                'CREATE TABLE IF NOT EXISTS media ('
+                'url TEXT PRIMARY KEY, path TEXT NOT NULL, size INTEGER NOT NULL, digest TEXT'
+                ') WITHOUT ROWID'
+            )
+
+    def contains(self, channel, article_id):
+        with self.lock:
+            row = self.conn.execute(
+                'SELECT 1 FROM articles WHERE channel = ? AND article_id = ?', (channel, article_id)
+            ).fetchone()
+        return row is not None
+
+    def add(self, channel, article_ids):
+        with self.lock, self.conn:
+            self.conn.executemany(
+                'INSERT OR IGNORE INTO articles VALUES (?, ?)', [(channel, x) for x in article_ids]
+            )
+
+    def forget(self, channel):
+        with self.lock, self.conn:
+            self.conn.execute('DELETE FROM articles WHERE channel = ?', (channel,))
+            self.conn.execute('DELETE FROM marks WHERE channel = ?', (channel,))
+            self.conn.execute('DELETE FROM journal WHERE channel = ?', (channel,))
+
+    def begin(self, channel, article_id, items):
+        # items: (src, path) of every media in the article
+        # the article is added to the history once all of them are done
+        with self.lock, self.conn:
+            if not items:
+                self.conn.execute('INSERT OR IGNORE INTO articles VALUES (?, ?)', (channel, article_id))
+                return
+            self.conn.executemany(
+                'INSERT OR IGNORE INTO journal (channel, article_id, src, path) VALUES (?, ?, ?, ?)',
+                [(channel, article_id, src, path) for src, path in items]
+            )
+
+    def media_done(self, channel, article_id, src):
+        # returns True if this completed the article
+        with self.lock, self.conn:
+            self.conn.execute(
+                'UPDATE journal SET done = 1 WHERE channel = ? AND article_id = ? AND src = ?',
+                (channel, article_id, src)
+            )
+            left = self.conn.execute(
+                'SELECT COUNT(*) FROM journal WHERE channel = ? AND article_id = ? AND done = 0', (channel, article_id)
+            ).fetchone()[0]
+            if left:
+                return False
+            self.conn.execute('INSERT OR IGNORE INTO articles VALUES (?, ?)', (channel, article_id))
+            self.conn.execute('DELETE FROM journal WHERE channel = ? AND article_id = ?', (channel, article_id))
+        return True
+
+    def pending(self, channel):
+        # unfinished media left by an interrupted run, {article_id: [(src, path)]}
+        with self.lock:
+            rows = self.conn.execute(
+                'SELECT article_id, src, path FROM journal WHERE channel = ? AND done = 0', (channel,)
+            ).fetchall()
+        pending = {}
+        for article_id, src, path in rows:
+            pending.setdefault(article_id, []).append((src, path))
+        return pending
+
+    def get_mark(self, channel, category, best):
+        with self.lock:
+            row = self.conn.execute(
+                'SELECT article_id FROM marks WHERE channel = ? AND category = ? AND best = ?',
+                (channel, category, int(best))
+            ).fetchone()
+        return row[0] if row else 0
+
+    def set_mark(self, channel, category, best, article_id):
+        with self.lock, self.conn:
+            self.conn.execute(
+                'INSERT OR REPLACE INTO marks VALUES (?, ?, ?, ?)', (channel, category, int(best), article_id)
+            )
+
+    def count(self, channel):
+        with self.lock:
+            return self.conn.execute('SELECT COUNT(*) FROM articles WHERE channel = ?', (channel,)).fetchone()[0]
+
+    def media_entry(self, url):
+        # (path, size, digest) of the last saved copy of url, None if never saved
+        with self.lock:
+            return self.conn.execute('SELECT path, size, digest FROM media WHERE url = ?', (url,)).fetchone()
+
+    def add_media(self, url, path, size, digest=None):
+        with self.lock, self.conn:
+            self.conn.execute('INSERT OR REPLACE INTO media VALUES (?, ?, ?, ?)', (url, path, size, digest))
+
+    def add_blob(self, digest, size):
+        with self.lock, self.conn:
+            self.conn.execute('INSERT OR IGNORE INTO blobs VALUES (?, ?, 0)', (digest, size))
+            self.conn.execute('UPDATE blobs SET links = links + 1 WHERE digest = ?', (digest,))
+
+    def dedup_report(self):
+        # (blob count, linked file count, bytes saved by deduplication)
+        with self.lock:
+            blobs, links, saved = self.conn.execute(
+                'SELECT COUNT(*), SUM(links), SUM((links - 1) * size) FROM blobs'
+            ).fetchone()
+        return blobs, links or 0, saved or 0
+
+    def channel(self, channel):
+        return ChannelHistory(self, channel)
+
+    def migrate(self, data):
+        # one-time move of the json article lists, returns True if settings need saving
+        migrated = False
+        for ch in data['channels']:
+            if ch['articles']:
+                self.add(ch['channel_url'], ch['articles'])
+                ch['articles'] = []
+                migrated = True
+        return migrated
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+
+# set-like view used by the duplicate check in filter_rows
+class ChannelHistory:
+    def __init__(self, history, channel):
+        self.history = history
+        self.channel = channel
+
+    def __contains__(self, article_id):
+        return self.history.contains(self.channel, article_id)
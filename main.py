@@ -1,7 +1,17 @@
-import json
 import os
 import re
+import queue
+import logging
+import logging.handlers
+import multiprocessing
+import config
 import downloader
+import history
+import pagecache
+import aio_downloader
+import scraper
+import sessions
+import throttle
 import traceback
 import webbrowser
 import tkinter as tk
@@ -15,8 +25,20 @@ class GUI:
         self.root = tk.Tk()
         self.new_setting = False
         self.data = None
+        self.history = None
+        self.page_cache = None
+        self.writer = config.SettingsWriter()
         try:
             self.load_settings()
+            scraper.set_backend(self.data.get('parser', 'auto'))
+            scraper.set_processes(self.data.get('parse_processes', 0))
+            throttle.configure(self.data.get('max_host_requests', 16), self.data.get('retries', 3))
+            sessions.configure(
+                self.data.get('max_host_requests', 16),
+                (self.data.get('connect_timeout', 10), self.data.get('read_timeout', 60)), self.data.get('cookies_file')
+            )
+            if self.data.get('page_cache', True):
+                self.page_cache = pagecache.PageCache(ttl=self.data.get('page_cache_ttl', 300))
         except PermissionError:
             self.root.withdraw()
             messagebox.showerror(
@@ -36,13 +58,12 @@ class GUI:
         # thread kill signal
         self.destroy = False
 
-        # downloaded article list - saved by main thread
-        self.article_list = []
+        # downloaded articles are recorded in self.history by the download journal
         self.selected_ch = None
 
         # root
         self.root.title('Arca-downloader')
-        self.root.geometry('510x300')
+        self.root.geometry('510x320')
         self.root.option_add('*tearOff', tk.FALSE)
         self.root.protocol('WM_DELETE_WINDOW', self.window_close)
         self.root.bind('<<DownloadComplete>>', self.download_completion)
@@ -55,6 +76,9 @@ class GUI:
 
         self.dl_mode = tk.IntVar(value=self.data['dl_mode'])
         self.log_mode = tk.IntVar(value=self.data['log_mode'])
+        self.engine = tk.StringVar(value=self.data.get('engine', 'thread'))
+        self.dedup = tk.BooleanVar(value=self.data.get('dedup', False))
+        self.media_order = tk.StringVar(value=self.data.get('media_order', 'document'))
 
         self.mnu_save = tk.Menu(self.mnu_main)
         self.mnu_save.add_radiobutton(label='/file.ext', variable=self.dl_mode, value=1, command=self.change_dl_mode)
@@ -67,6 +91,24 @@ class GUI:
         self.mnu_save.add_separator()
         self.mnu_save.add_command(label=self.data['dl_location'] or os.getcwd().replace('\\', '/'))
         self.mnu_save.add_command(label='Change save location', command=self.change_dl_location)
+        self.mnu_save.add_separator()
+        self.mnu_save.add_checkbutton(
+            label='Deduplicate media (hardlinks)', variable=self.dedup, onvalue=True, offvalue=False,
+            command=self.change_dedup
+        )
+        self.mnu_save.add_separator()
+        self.mnu_save.add_radiobutton(
+            label='Media order: as in article', variable=self.media_order, value='document',
+            command=self.change_media_order
+        )
+        self.mnu_save.add_radiobutton(
+            label='Media order: small first', variable=self.media_order, value='small_first',
+            command=self.change_media_order
+        )
+        self.mnu_save.add_radiobutton(
+            label='Media order: large first', variable=self.media_order, value='large_first',
+            command=self.change_media_order
+        )
 
         self.mnu_log = tk.Menu(self.mnu_main)
         self.mnu_log.add_radiobutton(
@@ -76,6 +118,14 @@ class GUI:
             label='Silent: log essential info', variable=self.log_mode, value=1, command=self.change_log_mode
         )
 
+        self.mnu_engine = tk.Menu(self.mnu_main)
+        self.mnu_engine.add_radiobutton(
+            label='Threads: requests', variable=self.engine, value='thread', command=self.change_engine
+        )
+        self.mnu_engine.add_radiobutton(
+            label='Asyncio: aiohttp', variable=self.engine, value='async', command=self.change_engine
+        )
+
         self.mnu_help = tk.Menu(self.mnu_main)
         self.mnu_help.add_command(
             label='Report issues', command=lambda: self.open_webpage('https://github.com/ostgor/arca-downloader/issues')
@@ -90,6 +140,7 @@ class GUI:
         self.mnu_main.add_command(label='Settings', command=lambda: SettingsPage(self))
         self.mnu_main.add_cascade(label='Save', menu=self.mnu_save)
         self.mnu_main.add_cascade(label='Log', menu=self.mnu_log)
+        self.mnu_main.add_cascade(label='Engine', menu=self.mnu_engine)
         self.mnu_main.add_cascade(label='Help', menu=self.mnu_help)
 
         self.root['menu'] = self.mnu_main
@@ -106,6 +157,18 @@ class GUI:
         self.root.rowconfigure(0, weight=1)
 
         # console
+        # log lines from any thread are queued and written to the widget in batches by poll_log
+        self.log_queue = queue.SimpleQueue()
+        self.log_lines = self.data.get('log_lines', 5000)
+        self.log_file = None
+        if self.data.get('log_file'):
+            self.log_file = logging.getLogger('arca_downloader')
+            self.log_file.setLevel(logging.INFO)
+            self.log_file.propagate = False
+            self.log_file.addHandler(logging.handlers.RotatingFileHandler(
+                self.data['log_file'], maxBytes=self.data.get('log_file_size', 1048576), backupCount=3,
+                encoding='utf-8'
+            ))
         self.txt_console = tk.Text(self.fr_console, relief='flat', width=40, font=('Consolas', 10), wrap='word')
         self.log('[Arca-Downloader v3 by obstgor@github]\n', essential=True)
         if self.new_setting:
@@ -197,8 +260,8 @@ class GUI:
         lbl_filter.grid(column=0, row=4, sticky='w', pady=(3, 3))
         self.cbb_filter.grid(column=0, row=5)
         self.fr_page.grid(column=0, row=6, pady=(15, 0), sticky='w')
-        self.btn_download.grid(column=0, row=8)
-        self.btn_folder.grid(column=0, row=9, pady=(8, 0))
+        self.btn_download.grid(column=0, row=9)
+        self.btn_folder.grid(column=0, row=10, pady=(8, 0))
 
         self.downloading = False
 
@@ -207,25 +270,51 @@ class GUI:
         self.chk_best = ttk.Checkbutton(
             self.fr_download, variable=self.best, text='Download best', onvalue=True, offvalue=False
         )
-        self.chk_best.grid(column=0, row=7, pady=10)
+        self.chk_best.grid(column=0, row=7, pady=(10, 0), sticky='w')
+
+        # sync: download new articles from page 1, end page becomes a limit
+        self.sync = tk.BooleanVar(value=self.data.get('sync', False))
+        self.chk_sync = ttk.Checkbutton(
+            self.fr_download, variable=self.sync, text='Sync new only', onvalue=True, offvalue=False
+        )
+        self.chk_sync.grid(column=0, row=8, pady=(0, 10), sticky='w')
+        ToolTip(self.chk_sync, text='Downloads from page 1 and stops at previously downloaded articles')
 
         # mainloop
+        self.poll_log()
         self.root.mainloop()
+        sessions.close()
+        scraper.close()
 
     def load_settings(self):
-        if os.path.exists('arca_downloader_settings.json'):
-            with open('arca_downloader_settings.json', 'r') as f:
-                self.data = json.load(f)
-            verify_data(self.data)
+        self.history = history.ArticleHistory()
+        if os.path.exists(config.SETTINGS_PATH):
+            self.data = config.load_settings()
+            # downloaded articles used to be stored in the settings file
+            if self.history.migrate(self.data):
+                self.flush_settings(log=False)
         else:
             self.new_setting = True
-            self.data = create_default()
-            self.write_settings(log=False)
-
-    def write_settings(self, log=True):
+            self.data = config.create_default()
+            self.flush_settings(log=False)
+
+    def write_settings(self, log=True, changed=None):
+        # bursts of changes are coalesced into one write
+        # changed: channel records that were modified, None if anything could have changed
+        self.writer.mark(changed)
+        self.writer.log = self.writer.log or log
+        if self.writer.job is None:
+            self.writer.job = self.txt_console.after(500, self.flush_settings)
+
+    def flush_settings(self, log=None):
+        if self.writer.job is not None:
+            self.txt_console.after_cancel(self.writer.job)
+            self.writer.job = None
+        if log is None:
+            log = self.writer.log
+        self.writer.log = False
         try:
-            with open('arca_downloader_settings.json', 'w') as f:
-                json.dump(self.data, f, indent=2)
+            self.writer.save(self.data)
         except PermissionError:
             if log:
                 self.log('settings not saved: type "save" to try again', essential=True)
@@ -249,26 +338,72 @@ class GUI:
             self.log('settings saved', essential=True)
 
     def log(self, *args: str, sep=' ', end='\n', essential=False):
+        # safe to call from downloader threads, the widget is only touched by write_log
         if self.data['log_mode'] == 0 or essential:
-            self.txt_console['state'] = 'normal'
-            self.txt_console.insert('end', sep.join(args) + end)
-            self.txt_console['state'] = 'disabled'
-            self.txt_console.see('end')
+            self.log_queue.put(sep.join(args) + end)
+
+    def poll_log(self):
+        self.write_log()
+        self.root.after(100, self.poll_log)
+
+    def write_log(self):
+        lines = []
+        try:
+            while True:
+                lines.append(self.log_queue.get_nowait())
+        except queue.Empty:
+            pass
+        if not lines:
+            return
+        text = ''.join(lines)
+        self.txt_console['state'] = 'normal'
+        self.txt_console.insert('end', text)
+        # keep the two header lines and the last log_lines lines
+        last = int(self.txt_console.index('end-1c').split('.')[0])
+        if last - 2 > self.log_lines:
+            self.txt_console.delete('3.0', f'{last - self.log_lines}.0')
+        self.txt_console['state'] = 'disabled'
+        self.txt_console.see('end')
+        if self.log_file:
+            self.log_file.info(text.rstrip('\n'))
+
+    def clear_console(self):
+        self.write_log()
+        self.txt_console['state'] = 'normal'
+        self.txt_console.delete('3.0', 'end')
+        self.txt_console.insert('end', '\n')
+        self.txt_console['state'] = 'disabled'
 
     def change_dl_mode(self):
         self.data['dl_mode'] = self.dl_mode.get()
-        self.write_settings()
+        self.write_settings(changed=[])
 
     def change_log_mode(self):
         self.data['log_mode'] = self.log_mode.get()
-        self.write_settings()
+        self.write_settings(changed=[])
+
+    def change_engine(self):
+        if self.engine.get() == 'async' and aio_downloader.aiohttp is None:
+            self.log('asyncio engine needs aiohttp: pip install aiohttp', essential=True)
+            self.engine.set('thread')
+            return
+        self.data['engine'] = self.engine.get()
+        self.write_settings(changed=[])
+
+    def change_dedup(self):
+        self.data['dedup'] = self.dedup.get()
+        self.write_settings(changed=[])
+
+    def change_media_order(self):
+        self.data['media_order'] = self.media_order.get()
+        self.write_settings(changed=[])
 
     def change_dl_location(self):
         newdir = filedialog.askdirectory(initialdir='.')
         if newdir == '':
             return
         self.data['dl_location'] = newdir
-        self.write_settings()
+        self.write_settings(changed=[])
         self.mnu_save.entryconfigure(4, label=newdir)
 
     def open_webpage(self, url):
@@ -290,11 +425,11 @@ class GUI:
             '3. You can use filters to avoid downloading downvoted articles or articles containing blacklisted words',
             '4. Manage filters by using the settings menu. You can use a filter specific to the channel you are trying'
             + ' to download, or use a default filter',
-            '5. Input page number to download, then click download button to start. The download process is currently'
-            + ' single threaded',
+            '5. Input page number to download, then click download button to start. Images and videos are downloaded'
+            + ' in parallel',
             '6. You can also download single articles by copy/pasting the article url to the text entry. Type "help"'
             + ' into the text entry for more information\n',
-            'Made with Python 3.9 using tkinter.\nExternal module used: requests, bs4',
+            'Made with Python 3.9 using tkinter.\nExternal module used: requests, bs4 (optional: lxml, aiohttp)',
             sep='\n', essential=True
         )
 
@@ -348,24 +483,24 @@ class GUI:
         self.cbb_filter.selection_clear()
 
     def download(self):
-        # clear console
-        self.txt_console['state'] = 'normal'
-        self.txt_console.delete('3.0', 'end')
-        self.txt_console.insert('end', '\n')
-        self.txt_console['state'] = 'disabled'
+        self.clear_console()
 
         self.selected_ch = self.ch_list[self.cbb_channel.current()]
         selected_cat = self.cat_list[self.cbb_category.current()]
         filter_mode = self.cbb_filter.current()
         start_pg, end_pg = sorted((self.start_pg.get(), self.end_pg.get()))
         best = self.best.get()
+        sync = self.sync.get()
+        if sync:
+            start_pg = 1
         # set prev data before download
         self.data['prev_ch'] = self.selected_ch['channel_name']
         self.data['best'] = best
+        self.data['sync'] = sync
         self.selected_ch['prev_category'] = self.cbb_category.current()
         self.selected_ch['filter'] = filter_mode
         self.selected_ch['dl_count'] += 1
-        self.write_settings()
+        self.write_settings(changed=[self.selected_ch])
         # disable widgets
         self.btn_download.state(['disabled'])
         self.cbb_channel.state(['disabled'])
@@ -379,10 +514,15 @@ class GUI:
         self.ent_console.state(['disabled'])
         # start download
         self.downloading = True
-        downloader.Downloader(self, self.selected_ch, selected_cat, start_pg, end_pg, filter_mode, best).start()
+        if self.data.get('engine') == 'async' and aio_downloader.aiohttp is not None:
+            engine = aio_downloader.AsyncDownloader
+        else:
+            engine = downloader.Downloader
+        engine(self, self.selected_ch, selected_cat, start_pg, end_pg, filter_mode, best, sync).start()
 
     def window_close(self):
         if not self.downloading:
+            self.flush_settings()
             self.root.destroy()
         else:
             answer = messagebox.askyesno(
@@ -396,10 +536,8 @@ class GUI:
                 return
 
     def download_completion(self, event):
-        self.selected_ch['articles'].extend(self.article_list)
-        self.article_list.clear()
-        self.write_settings()
         if self.destroy:
+            self.flush_settings()
             self.root.destroy()
             return
         self.downloading = False
@@ -429,16 +567,20 @@ class GUI:
                 '- "clear": clears logging console\n',
                 '- "save": save current settings. settings are automatically saved, so there is no reason to use this, '
                 + 'except when trying again due to an error while saving\n',
+                '- "dedup": prints how much space media deduplication saved\n',
                 '- "help": prints this to the logging console',
                 sep='\n', essential=True
             )
         elif command == 'save':
-            self.write_settings()
+            self.writer.mark()
+            self.flush_settings(log=True)
+        elif command == 'dedup':
+            blobs, links, saved = self.history.dedup_report()
+            self.log(
+                f'dedup: {links} files stored as {blobs} blobs, {saved / 1048576:.1f}MB saved', essential=True
+            )
         elif command == 'clear':
-            self.txt_console['state'] = 'normal'
-            self.txt_console.delete('3.0', 'end')
-            self.txt_console.insert('end', '\n')
-            self.txt_console['state'] = 'disabled'
+            self.clear_console()
         else:
             self.log('invalid command, type "help" for info', essential=True)
 
@@ -462,6 +604,8 @@ class ChannelPage(GUI):
         self.gui = gui
         self.data = gui.data
         self.txt_console = gui.txt_console
+        self.log_queue = gui.log_queue
+        self.writer = gui.writer
 
         # new window
         self.window = tk.Toplevel(gui.root)
@@ -511,7 +655,8 @@ class ChannelPage(GUI):
         )
         if not ans:
             return
-        del self.data['channels'][self.lst_channels.curselection()[0]]
+        ch_data = self.data['channels'].pop(self.lst_channels.curselection()[0])
+        self.gui.history.forget(ch_data['channel_url'])
         self.write_settings()
         self.list_variable.set([x['channel_name'] for x in self.data['channels']])
         if not self.lst_channels.curselection():
@@ -527,7 +672,7 @@ class ChannelPage(GUI):
             self.warn('URL not valid')
             return
         ch_url = match.group(0)
-        ch_data = default_setting()
+        ch_data = config.default_setting()
         try:
             ch_data = downloader.ch_register(ch_url, ch_data)
         except Exception as expt:
@@ -558,6 +703,8 @@ class SettingsPage(GUI):
     def __init__(self, gui):
         self.data = gui.data
         self.txt_console = gui.txt_console
+        self.log_queue = gui.log_queue
+        self.writer = gui.writer
 
         self.window = tk.Toplevel(gui.root)
         self.window.geometry(f'+{gui.root.winfo_rootx()}+{gui.root.winfo_rooty()}')
@@ -578,6 +725,9 @@ class SettingsPage(GUI):
         self.combined = tk.BooleanVar()
         self.category = tk.BooleanVar()
         self.fav = tk.BooleanVar()
+        self.size = tk.BooleanVar()
+        self.video = tk.BooleanVar()
+        self.media_type = tk.BooleanVar()
 
         # frame
         lbl_channel = ttk.Label(self.window, text='Filter')
@@ -623,19 +773,37 @@ class SettingsPage(GUI):
             labelframe, variable=self.fav, text='Favorite (shows at top)', style='my.TCheckbutton',
             onvalue=True, offvalue=False
         )
+        chk_size = ttk.Checkbutton(
+            labelframe, variable=self.size, text='Skip media larger than (MB)', style='my.TCheckbutton',
+            onvalue=True, offvalue=False
+        )
+        chk_video = ttk.Checkbutton(
+            labelframe, variable=self.video, text='Skip videos larger than (MB)', style='my.TCheckbutton',
+            onvalue=True, offvalue=False
+        )
+        chk_type = ttk.Checkbutton(
+            labelframe, variable=self.media_type, text='Skip media by type', style='my.TCheckbutton',
+            onvalue=True, offvalue=False
+        )
 
         ToolTip(chk_upvote, text='Downloads article if upvote count is greater than or equal the setting count')
         ToolTip(chk_downvote, text='Downloads article if downvote count is less than or equal the setting count')
         ToolTip(chk_combined, text='Downloads article if combined count is greater than or equal the setting count')
+        ToolTip(chk_size, text='Checks media size before downloading, needs a HEAD request per media')
+        ToolTip(chk_video, text='Checks video size before downloading, needs a HEAD request per media')
+        ToolTip(chk_type, text='Skips media whose type starts with a listed type, e.g. video/ or image/gif')
 
         btn_title = ttk.Button(labelframe, text='Manage', command=lambda: BlackList(self, 'title_bl'))
         btn_content = ttk.Button(labelframe, text='Manage', command=lambda: BlackList(self, 'content_bl'))
         btn_uploader = ttk.Button(labelframe, text='Manage', command=lambda: BlackList(self, 'uploader_bl'))
         self.btn_category = ttk.Button(labelframe, text='Manage', command=lambda: CategoryBlackList(self))
+        btn_type = ttk.Button(labelframe, text='Manage', command=lambda: BlackList(self, 'type_bl'))
 
         self.upvote_num = tk.IntVar()
         self.downvote_num = tk.IntVar()
         self.combined_num = tk.IntVar()
+        self.size_num = tk.IntVar()
+        self.video_num = tk.IntVar()
 
         spb_upvote = ttk.Spinbox(labelframe, width=4, textvariable=self.upvote_num, from_=0, to=999, increment=1)
         spb_upvote.state(['readonly'])
@@ -643,6 +811,10 @@ class SettingsPage(GUI):
         spb_downvote.state(['readonly'])
         spb_combined = ttk.Spinbox(labelframe, width=4, textvariable=self.combined_num, from_=-999, to=999, increment=1)
         spb_combined.state(['readonly'])
+        spb_size = ttk.Spinbox(labelframe, width=4, textvariable=self.size_num, from_=0, to=9999, increment=10)
+        spb_size.state(['readonly'])
+        spb_video = ttk.Spinbox(labelframe, width=4, textvariable=self.video_num, from_=0, to=9999, increment=10)
+        spb_video.state(['readonly'])
 
         ToolTip(spb_upvote, text='Downloads article if upvote count is greater than or equal the setting count')
         ToolTip(spb_downvote, text='Downloads article if downvote count is less than or equal the setting count')
@@ -651,11 +823,14 @@ class SettingsPage(GUI):
         spb_upvote.grid(column=1, row=6)
         spb_downvote.grid(column=1, row=8)
         spb_combined.grid(column=1, row=10)
+        spb_size.grid(column=1, row=14)
+        spb_video.grid(column=1, row=16)
 
         btn_title.grid(column=1, row=0, padx=(0, 10))
         btn_content.grid(column=1, row=2, padx=(0, 10))
         btn_uploader.grid(column=1, row=4, padx=(0, 10))
         self.btn_category.grid(column=1, row=12, padx=(0, 10))
+        btn_type.grid(column=1, row=18, padx=(0, 10))
 
         chk_title.grid(column=0, row=0, sticky='w', padx=(10, 5), pady=3)
         chk_content.grid(column=0, row=2, sticky='w', padx=(10, 5), pady=3)
@@ -664,7 +839,10 @@ class SettingsPage(GUI):
         chk_downvote.grid(column=0, row=8, sticky='w', padx=(10, 5), pady=3)
         chk_combined.grid(column=0, row=10, sticky='w', padx=(10, 5), pady=3)
         self.chk_category.grid(column=0, row=12, sticky='w', padx=(10, 5), pady=3)
-        self.chk_fav.grid(column=0, row=14, sticky='w', padx=(10, 5), pady=3)
+        chk_size.grid(column=0, row=14, sticky='w', padx=(10, 5), pady=3)
+        chk_video.grid(column=0, row=16, sticky='w', padx=(10, 5), pady=3)
+        chk_type.grid(column=0, row=18, sticky='w', padx=(10, 5), pady=3)
+        self.chk_fav.grid(column=0, row=20, sticky='w', padx=(10, 5), pady=3)
 
         # channel combobox
         self.cbb_channel = ttk.Combobox(self.window)
@@ -689,7 +867,7 @@ class SettingsPage(GUI):
         # check if previous channel existed and if so save previous channel
         if self.selected_ch is not None:
             self.update_data()
-            self.write_settings()
+            self.write_settings(changed=[self.selected_ch])
 
         self.cbb_channel.selection_clear()
         self.selected_ch = self.ch_list[self.cbb_channel.current()]
@@ -714,10 +892,15 @@ class SettingsPage(GUI):
         self.upvote_num.set(self.selected_ch['upvote_num'])
         self.downvote_num.set(self.selected_ch['downvote_num'])
         self.combined_num.set(self.selected_ch['combined_num'])
+        self.size.set(self.selected_ch['size'])
+        self.video.set(self.selected_ch['video'])
+        self.media_type.set(self.selected_ch['type'])
+        self.size_num.set(self.selected_ch['size_num'])
+        self.video_num.set(self.selected_ch['video_num'])
 
     def window_close(self):
         self.update_data()
-        self.write_settings()
+        self.write_settings(changed=[self.selected_ch])
         self.window.grab_release()
         self.window.destroy()
 
@@ -733,13 +916,21 @@ class SettingsPage(GUI):
         self.selected_ch['upvote_num'] = self.upvote_num.get()
         self.selected_ch['downvote_num'] = self.downvote_num.get()
         self.selected_ch['combined_num'] = self.combined_num.get()
+        self.selected_ch['size'] = self.size.get()
+        self.selected_ch['video'] = self.video.get()
+        self.selected_ch['type'] = self.media_type.get()
+        self.selected_ch['size_num'] = self.size_num.get()
+        self.selected_ch['video_num'] = self.video_num.get()
 
 
 class BlackList(SettingsPage):
     def __init__(self, settings, attr: str):
         self.data = settings.data
+        self.selected_ch = settings.selected_ch
         self.bl_list = settings.selected_ch[attr]
         self.txt_console = settings.txt_console
+        self.log_queue = settings.log_queue
+        self.writer = settings.writer
 
         # new window
         self.window = tk.Toplevel(settings.window)
@@ -796,7 +987,7 @@ class BlackList(SettingsPage):
 
     def delete_blacklist(self):
         del self.bl_list[self.lst_blacklist.curselection()[0]]
-        self.write_settings()
+        self.write_settings(changed=[self.selected_ch])
         self.list_variable.set(self.bl_list)
         if not self.lst_blacklist.curselection():
             self.btn_delete.state(['disabled'])
@@ -809,7 +1000,7 @@ class BlackList(SettingsPage):
             return
         self.bl_list.append(word)
         self.list_variable.set(self.bl_list)
-        self.write_settings()
+        self.write_settings(changed=[self.selected_ch])
         self.lst_blacklist.see(len(self.bl_list) - 1)
 
     def warn(self, text):
@@ -827,6 +1018,8 @@ class CategoryBlackList(SettingsPage):
         self.selected_ch = settings.selected_ch
         self.bl_list = self.selected_ch['category_bl']
         self.txt_console = settings.txt_console
+        self.log_queue = settings.log_queue
+        self.writer = settings.writer
 
         # new window
         self.window = tk.Toplevel(settings.window)
@@ -886,12 +1079,12 @@ class CategoryBlackList(SettingsPage):
             values=[x[1] for x in self.selected_ch['channel_category'] if x[1] not in self.bl_list][1:]
         )
         self.list_variable.set(self.bl_list)
-        self.write_settings()
+        self.write_settings(changed=[self.selected_ch])
         self.lst_blacklist.see(len(self.bl_list) - 1)
 
     def delete_blacklist(self):
         del self.bl_list[self.lst_blacklist.curselection()[0]]
-        self.write_settings()
+        self.write_settings(changed=[self.selected_ch])
         self.list_variable.set(self.bl_list)
         # refresh combobox
         self.cbb_blacklist.configure(
@@ -945,89 +1138,8 @@ class ToolTip:
             return
 
 
-def create_default():
-    data = {
-        'default': default_setting(),
-        'channels': [],
-        'dl_mode': 3,
-        'dl_location': None,
-        'prev_ch': None,
-        'log_mode': 0,
-        'best': False
-    }
-    return data
-
-
-def verify_data(data):
-    def verify_settings(data, is_channel):
-        if type(data) is dict:
-            for key in default_setting():
-                if key not in data:
-                    raise Exception(f'no <{key}> in settings')
-            for key in (
-                    'title', 'content', 'upvote', 'downvote', 'combined', 'uploader', 'fav', 'category'):
-                if type(data[key]) is not bool:
-                    raise Exception('not a boolean')
-            for key in ('combined_num', 'downvote_num', 'upvote_num', 'dl_count', 'prev_category', 'filter'):
-                if type(data[key]) is not int:
-                    raise Exception('not an int')
-            for key in ('channel_category', 'category_bl', 'title_bl', 'content_bl', 'uploader_bl', 'articles'):
-                if type(data[key]) is not list:
-                    raise Exception('not a list')
-        else:
-            raise Exception('data not a dict')
-        if is_channel:
-            if (type(data['channel_name']) is not str) or (type(data['channel_url']) is not str):
-                raise Exception('channel name or url corrupted')
-            elif len(data['channel_category']) == 0:
-                raise Exception('no channel category')
-            return
-        else:
-            return
-
-    verify_settings(data['default'], False)
-    for channel in data['channels']:
-        verify_settings(channel, True)
-    if type(data['dl_mode']) is not int:
-        raise Exception('dl_mode not int')
-    if type(data['log_mode']) is not int:
-        raise Exception('log_mode not int')
-    if type(data['best']) is not bool:
-        raise Exception('best not bool')
-    if 'dl_location' not in data:
-        raise Exception('dl_location not in data')
-    if 'prev_ch' not in data:
-        raise Exception('prev_ch not in data')
-
-
-def default_setting():
-    df_setting = {
-        'channel_name': None,
-        'channel_url': None,
-        'channel_category': [],
-        'prev_category': 0,
-        'filter': 0,
-        'dl_count': 0,
-        'fav': False,
-        'category': False,
-        'category_bl': [],
-        'title': False,
-        'title_bl': [],
-        'content': False,
-        'content_bl': [],
-        'upvote': False,
-        'upvote_num': 0,
-        'downvote': False,
-        'downvote_num': 0,
-        'combined': False,
-        'combined_num': 0,
-        'uploader': False,
-        'uploader_bl': [],
-        'articles': []
-    }
-    return df_setting
-
-
 # TODO: implement warning if category to download is blacklisted
 if __name__ == '__main__':
+    # parse worker processes of a frozen build start through here
+    multiprocessing.freeze_support()
     GUI()
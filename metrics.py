@@ -0,0 +1,115 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+
+METRICS_PATH = 'arca_downloader_metrics.jsonl'
+# histogram bucket upper bounds in seconds
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+def escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class Histogram:
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        i = 0
+        while i < len(BUCKETS) and value > BUCKETS[i]:
+            i += 1
+        self.counts[i] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def report(self):
+        # cumulative bucket counts like prometheus, the last bucket is +Inf
+        buckets = {}
+        total = 0
+        for bound, count in zip(BUCKETS + ('+Inf',), self.counts):
+            total += count
+            buckets[str(bound)] = total
+        return {
+            'count': self.count, 'sum': round(self.sum, 6), 'max': round(self.max, 6),
+            'mean': round(self.sum / self.count, 6) if self.count else None, 'buckets': buckets
+        }
+
+
+# timings (seconds per request or item) and counters (bytes, skips by reason) of one download run
+# stages: listing_fetch, listing_parse, filter, article_fetch, article_parse, media_ttfb, media_transfer, disk_write
+class Metrics:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.start = time.time()
+        self.stages = {}
+        self.counters = {}
+
+    def observe(self, stage, seconds):
+        with self.lock:
+            if stage not in self.stages:
+                self.stages[stage] = Histogram()
+            self.stages[stage].observe(seconds)
+
+    @contextmanager
+    def time(self, stage):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start)
+
+    def add(self, counter, value=1):
+        with self.lock:
+            self.counters[counter] = self.counters.get(counter, 0) + value
+
+    def skip(self, reason):
+        self.add('skip_' + reason)
+
+    def report(self, **info):
+        # info: run details stored with the metrics (channel, elapsed, ...)
+        with self.lock:
+            return dict(
+                info,
+                time=time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(self.start)),
+                elapsed=round(time.time() - self.start, 3),
+                stages={stage: hist.report() for stage, hist in self.stages.items()},
+                counters=dict(self.counters)
+            )
+
+    def prometheus(self, labels=None):
+        # text exposition format, for the node exporter textfile collector
+        label_text = ','.join(f'{key}="{escape(value)}"' for key, value in (labels or {}).items())
+        lines = ['# TYPE arca_stage_seconds histogram']
+        with self.lock:
+            for stage, hist in sorted(self.stages.items()):
+                prefix = f'stage="{stage}"' + (',' + label_text if label_text else '')
+                for bound, count in hist.report()['buckets'].items():
+                    lines.append(f'arca_stage_seconds_bucket{{{prefix},le="{bound}"}} {count}')
+                lines.append(f'arca_stage_seconds_sum{{{prefix}}} {hist.sum}')
+                lines.append(f'arca_stage_seconds_count{{{prefix}}} {hist.count}')
+            lines.append('# TYPE arca_total counter')
+            for counter, value in sorted(self.counters.items()):
+                prefix = f'name="{counter}"' + (',' + label_text if label_text else '')
+                lines.append(f'arca_total{{{prefix}}} {value}')
+        return '\n'.join(lines) + '\n'
+
+    def save(self, data, labels=None, **info):
+        # appends the report to data['metrics_file'], writes data['metrics_prom'] when set
+        path = data.get('metrics_file', METRICS_PATH)
+        if path:
+            with open(path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(self.report(**info), ensure_ascii=False) + '\n')
+        prom = data.get('metrics_prom')
+        if prom:
+            # replaced atomically so the collector never reads half a file
+            with open(prom + '.tmp', 'w', encoding='utf-8') as f:
+                f.write(self.prometheus(labels))
+            os.replace(prom + '.tmp', prom)
@@ -0,0 +1,64 @@
+import json
+import sqlite3
+import threading
+import time
+
+
+CACHE_PATH = 'arca_downloader_cache.db'
+
+
+# listing page cache keyed by page url, stores the parsed rows instead of the html
+# pages with an etag or last-modified are revalidated, others are reused for ttl seconds
+class PageCache:
+    def __init__(self, path=CACHE_PATH, ttl=300, max_age=7 * 86400):
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.lock = threading.Lock()
+        self.ttl = ttl
+        with self.lock, self.conn:
+            self.conn.execute(
+                'CREATE TABLE IF NOT EXISTS pages ('
+                'url TEXT PRIMARY KEY, etag TEXT, last_modified TEXT, fetched REAL NOT NULL, rows TEXT NOT NULL'
+                ') WITHOUT ROWID'
+            )
+            self.conn.execute('DELETE FROM pages WHERE fetched < ?', (time.time() - max_age,))
+
+    def lookup(self, url):
+        with self.lock:
+            return self.conn.execute(
+                'SELECT etag, last_modified, fetched, rows FROM pages WHERE url = ?', (url,)
+            ).fetchone()
+
+    def fresh(self, entry):
+        # entries without validators can't be revalidated, they expire after ttl
+        etag, last_modified, fetched, _ = entry
+        return not etag and not last_modified and time.time() - fetched < self.ttl
+
+    @staticmethod
+    def request_headers(entry):
+        headers = {}
+        if entry:
+            etag, last_modified, _, _ = entry
+            if etag:
+                headers['If-None-Match'] = etag
+            if last_modified:
+                headers['If-Modified-Since'] = last_modified
+        return headers
+
+    @staticmethod
+    def rows(entry):
+        return json.loads(entry[3])
+
+    def store(self, url, headers, rows):
+        with self.lock, self.conn:
+            self.conn.execute(
+                'INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?, ?)',
+                (url, headers.get('ETag'), headers.get('Last-Modified'), time.time(), json.dumps(rows))
+            )
+
+    def touch(self, url):
+        with self.lock, self.conn:
+            self.conn.execute('UPDATE pages SET fetched = ? WHERE url = ?', (time.time(), url))
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
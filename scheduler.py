@@ -0,0 +1,51 @@
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+import headless
+import sessions
+
+
+Job = namedtuple('Job', ['channel', 'category', 'startpg', 'endpg', 'filter_mode', 'best', 'sync'])
+Job.__new__.__defaults__ = (None, 1, 1, None, False, False)
+
+
+def all_channels(context, startpg=1, endpg=1, filter_mode=None, best=False, sync=False):
+    return [Job(ch['channel_url'], None, startpg, endpg, filter_mode, best, sync) for ch in context.data['channels']]
+
+
+# runs many download jobs at once on the thread engine
+# every job uses one session whose pool caps connections per host at max_connections
+# finished articles reach the shared history through the download journal as usual
+class BatchScheduler:
+    def __init__(self, context, max_jobs=4, max_connections=16):
+        self.context = context
+        self.max_jobs = max_jobs
+        self.session = sessions.pooled_session(max_connections, block=True)
+
+    def run(self, jobs):
+        # returns one result per job, in job order
+        executor = ThreadPoolExecutor(max_workers=self.max_jobs)
+        futures = [executor.submit(self.run_job, job) for job in jobs]
+        try:
+            return [future.result() for future in futures]
+        except KeyboardInterrupt:
+            self.context.destroy = True
+            raise
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    def run_job(self, job):
+        if self.context.destroy:
+            return job_result(job, 'stopped')
+        self.context.log(f'\n[job] {job.channel} {job.category or ""} {job.startpg}-{job.endpg}', essential=True)
+        try:
+            return headless.download(self.context, *job, engine='thread', session=self.session)
+        except ValueError as expt:
+            self.context.log(str(expt), essential=True)
+            return job_result(job, str(expt))
+
+
+def job_result(job, error):
+    return {
+        'saved': 0, 'failed': 0, 'error': error, 'channel': job.channel, 'category': job.category,
+        'pages': [job.startpg, job.endpg]
+    }
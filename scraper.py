@@ -0,0 +1,199 @@
+import asyncio
+import multiprocessing
+import threading
+import bs4
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    import lxml
+except ImportError:
+    lxml = None
+
+
+# html parsing layer, returns plain records so the engines never touch soup objects
+# lxml is used when installed, html.parser otherwise
+BACKEND = 'lxml' if lxml is not None else 'html.parser'
+# only build the tree for the regions the extractors use
+STRAIN = True
+# worker processes for parse(), 0 parses on the calling thread
+PROCESSES = 0
+pool = None
+pool_lock = threading.Lock()
+
+
+def has_class(*names):
+    # strainer match on any of names, class_= skips elements with more than one class on newer bs4
+    names = set(names)
+
+    def match(value):
+        if not value:
+            return False
+        return not names.isdisjoint(value.split() if isinstance(value, str) else value)
+    return match
+
+
+HEAD_REGION = bs4.SoupStrainer('head')
+LISTING_REGION = bs4.SoupStrainer(attrs={'class': has_class('vrow')})
+ARTICLE_REGION = bs4.SoupStrainer(attrs={'class': has_class('article-info', 'article-content')})
+CHANNEL_REGION = bs4.SoupStrainer(attrs={'class': has_class('board-title', 'board-category')})
+
+# everything parse_article needs comes before the comments
+ARTICLE_CONTENT = b'article-content'
+ARTICLE_END = b'article-comment'
+ARTICLE_CHUNK = 16384
+# after the cut the rest of the page is still read and dropped when at most this much is left,
+# a response read to the end keeps its connection for the next request
+ARTICLE_DRAIN = 131072
+
+
+def set_backend(name='auto', strain=True):
+    global BACKEND, STRAIN
+    if name == 'lxml' or name == 'auto':
+        BACKEND = 'lxml' if lxml is not None else 'html.parser'
+    else:
+        BACKEND = 'html.parser'
+    STRAIN = strain
+
+
+def set_processes(count=0):
+    # parsing holds the gil, worker processes let large backfills parse on several cores
+    global PROCESSES
+    close()
+    PROCESSES = count
+
+
+def get_pool():
+    # started on first use so the gui does not spawn processes it never needs
+    global pool
+    with pool_lock:
+        if pool is None and PROCESSES:
+            name = 'lxml' if BACKEND == 'lxml' else 'html.parser'
+            # spawn, forking a process that runs gui and download threads can copy held locks
+            pool = ProcessPoolExecutor(
+                max_workers=PROCESSES, mp_context=multiprocessing.get_context('spawn'),
+                initializer=set_backend, initargs=(name, STRAIN)
+            )
+        return pool
+
+
+def parse(func, text):
+    # func: parse_listing, parse_article or parse_channel, run in a worker process when a pool is set
+    executor = get_pool()
+    if executor is None:
+        return func(text)
+    return executor.submit(func, text).result()
+
+
+async def parse_async(func, text):
+    # without worker processes the parse runs on a thread, not on the event loop
+    executor = get_pool()
+    if executor is None:
+        return await asyncio.get_running_loop().run_in_executor(None, func, text)
+    return await asyncio.wrap_future(executor.submit(func, text))
+
+
+def close():
+    global pool
+    with pool_lock:
+        if pool is not None:
+            pool.shutdown(wait=True, cancel_futures=True)
+            pool = None
+
+
+def make_soup(text, region=None):
+    return bs4.BeautifulSoup(text, BACKEND, parse_only=region if STRAIN else None)
+
+
+def parse_listing(text):
+    rows = []
+    for tag in make_soup(text, LISTING_REGION).select('[class=vrow]'):
+        rate = tag.select_one('.col-rate')
+        badge = tag.select_one('.badge')
+        user_info = tag.select_one('.user-info')
+        rows.append({
+            'url': tag['href'],
+            'title': tag.select_one('.title').getText(),
+            'preview': tag.select_one('.vrow-preview') is not None,
+            'rate': rate.getText() if rate else None,
+            'badge': badge.get_text() if badge else None,
+            'user_info': str(user_info) if user_info else None
+        })
+    return rows
+
+
+def parse_article(text):
+    soup = make_soup(text, ARTICLE_REGION)
+    if STRAIN:
+        # the head is small and comes first, no need to scan the body for it
+        end = text.find('</head>')
+        head = make_soup(text[:end + 7] if end != -1 else text, HEAD_REGION)
+    else:
+        head = soup
+    content = soup.select_one('.article-content')
+    upvote = soup.select_one('.article-info .body:nth-child(2)')
+    downvote = soup.select_one('.article-info .body:nth-child(5)')
+    src_list = []
+    for tag in soup.select('.article-content img') + soup.select('.article-content video'):
+        src = tag.get('src')
+        if src:
+            src_list.append(src if src.startswith('https:') else 'https:' + src)
+    return {
+        'head': head.select_one('head title').get_text(),
+        'content': content.get_text() if content else None,
+        'upvote': upvote.get_text() if upvote else None,
+        'downvote': downvote.get_text() if downvote else None,
+        'srcs': src_list
+    }
+
+
+# collects an article page from a streamed response and tells when the rest can be dropped
+# the page is cut at the tag holding ARTICLE_END, the parsers close the open tags themselves
+class ArticleReader:
+    def __init__(self, length=None):
+        # length: of the decoded body if known, see body_length
+        self.length = length
+        self.buffer = bytearray()
+        # bytes received, including any that were cut
+        self.size = 0
+        self.drained = 0
+        self.content_at = -1
+        self.done = False
+
+    def feed(self, chunk):
+        # returns True once the rest of the response can be dropped
+        self.size += len(chunk)
+        if self.done:
+            self.drained += len(chunk)
+            return self.drained > ARTICLE_DRAIN
+        start = max(0, len(self.buffer) - len(ARTICLE_END))
+        self.buffer += chunk
+        if self.content_at == -1:
+            self.content_at = self.buffer.find(ARTICLE_CONTENT, start)
+            if self.content_at == -1:
+                return False
+            start = self.content_at
+        end = self.buffer.find(ARTICLE_END, start)
+        if end != -1:
+            del self.buffer[self.buffer.rfind(b'<', 0, end):]
+            self.done = True
+            # a long rest is cut right away, an unknown one is drained up to ARTICLE_DRAIN
+            return self.length is not None and self.length - self.size > ARTICLE_DRAIN
+        return False
+
+    def text(self, encoding=None):
+        return self.buffer.decode(encoding or 'utf-8', 'replace')
+
+
+def body_length(headers):
+    # decoded length of a response body, None if it is unknown or compressed
+    if headers.get('Content-Encoding', 'identity') != 'identity':
+        return None
+    length = headers.get('Content-Length')
+    return int(length) if length and length.isdigit() else None
+
+
+def parse_channel(text):
+    soup = make_soup(text, CHANNEL_REGION)
+    name = soup.select_one('.board-title > a:last-of-type')
+    categories = [[tag['href'], tag.get_text()] for tag in soup.select('.board-category a')]
+    return name.get_text() if name else None, categories
@@ -0,0 +1,87 @@
+import json
+import os
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+
+
+# process wide http session, shared by every download, console url download and channel registration
+# connections to arca.live and the media hosts stay alive between jobs
+POOL_SIZE = 16
+# host pools kept, arca.live plus the media hosts
+POOL_HOSTS = 10
+TIMEOUT = (10, 60)
+COOKIES_PATH = None
+
+lock = threading.Lock()
+session = None
+
+
+def configure(pool_size=16, timeout=(10, 60), cookies_path=None):
+    # pool_size: kept-alive connections per host, matches the per host request limit of throttle
+    # cookies_path: json file the session cookies are loaded from and saved to, None to not persist them
+    global POOL_SIZE, TIMEOUT, COOKIES_PATH
+    POOL_SIZE = pool_size
+    TIMEOUT = timeout
+    COOKIES_PATH = cookies_path
+
+
+# requests session with a default (connect, read) timeout
+class TimeoutSession(requests.Session):
+    def __init__(self, timeout=None):
+        requests.Session.__init__(self)
+        self.timeout = timeout or TIMEOUT
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+        return requests.Session.request(self, method, url, **kwargs)
+
+
+def pooled_session(size, block=False):
+    # a separate session whose pool keeps size connections per host
+    # block: size is a hard limit of connections per host, requests wait for a free one
+    new = TimeoutSession()
+    adapter = HTTPAdapter(pool_connections=POOL_HOSTS, pool_maxsize=size, pool_block=block)
+    new.mount('https://', adapter)
+    new.mount('http://', adapter)
+    return new
+
+
+def shared():
+    global session
+    with lock:
+        if session is None:
+            session = pooled_session(POOL_SIZE)
+            if COOKIES_PATH:
+                load_cookies(session, COOKIES_PATH)
+        return session
+
+
+def close():
+    # saves the cookies, the next shared() starts a new session
+    global session
+    with lock:
+        if session is None:
+            return
+        if COOKIES_PATH:
+            save_cookies(session, COOKIES_PATH)
+        session.close()
+        session = None
+
+
+def load_cookies(target, path):
+    if not os.path.exists(path):
+        return
+    with open(path, encoding='utf-8') as f:
+        for cookie in json.load(f):
+            target.cookies.set(**cookie)
+
+
+def save_cookies(source, path):
+    cookies = [
+        {'name': c.name, 'value': c.value, 'domain': c.domain, 'path': c.path, 'expires': c.expires, 'secure': c.secure}
+        for c in source.cookies if not c.is_expired()
+    ]
+    with open(path + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(cookies, f, indent=2)
+    os.replace(path + '.tmp', path)
@@ -0,0 +1,229 @@
+import asyncio
+import random
+import sys
+import threading
+import time
+import weakref
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlsplit
+
+
+# statuses worth another try, 429 and 503 also shrink the host's window
+RETRY_STATUS = {429, 500, 502, 503, 504}
+THROTTLE_STATUS = {429, 503}
+# article pages that are gone, skipped instead of failing the download
+SKIP_STATUS = {403, 404, 410}
+# media that will not come back, its journal entry is given up
+GONE_STATUS = {404, 410}
+
+# process wide, shared by every download and batch job
+MAX_WINDOW = 16
+RETRIES = 3
+BACKOFF = 0.5
+MAX_BACKOFF = 30
+# connection errors of aiohttp requests, see async_errors
+ASYNC_ERRORS = None
+
+
+def configure(max_window=16, retries=3):
+    global MAX_WINDOW, RETRIES
+    MAX_WINDOW = max_window
+    RETRIES = retries
+
+
+# aimd limit of concurrent requests to one host
+# the window grows by one per window of successes and halves on 429/503, retry-after pauses the host
+class HostLimiter:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.window = float(MAX_WINDOW)
+        self.in_flight = 0
+        self.paused_until = 0.0
+
+    def try_acquire(self):
+        # returns 0 if a request may start, otherwise seconds to wait before asking again
+        with self.lock:
+            pause = self.paused_until - time.monotonic()
+            if pause > 0:
+                return pause
+            if self.in_flight >= int(self.window):
+                return 0.05
+            self.in_flight += 1
+            return 0
+
+    def acquire(self):
+        while True:
+            wait = self.try_acquire()
+            if not wait:
+                return
+            time.sleep(wait)
+
+    async def acquire_async(self):
+        while True:
+            wait = self.try_acquire()
+            if not wait:
+                return
+            await asyncio.sleep(wait)
+
+    def release(self, status=None, retry_after=None):
+        # status: response status, None if the request failed without one
+        with self.lock:
+            self.in_flight -= 1
+            if status in THROTTLE_STATUS:
+                self.window = max(1.0, self.window / 2)
+                if retry_after:
+                    pause = min(retry_after, MAX_BACKOFF)
+                    self.paused_until = max(self.paused_until, time.monotonic() + pause)
+            elif status is not None and status < 400:
+                self.window = min(float(MAX_WINDOW), self.window + 1 / self.window)
+
+
+limiters = {}
+limiters_lock = threading.Lock()
+
+
+def limiter(url):
+    host = urlsplit(url).hostname
+    with limiters_lock:
+        if host not in limiters:
+            limiters[host] = HostLimiter()
+        return limiters[host]
+
+
+def retry_after(value):
+    # seconds from a retry-after header, either delta seconds or an http date
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def async_errors():
+    # aiohttp is imported on first use, thread engine runs never load it
+    global ASYNC_ERRORS
+    if ASYNC_ERRORS is None:
+        try:
+            import aiohttp
+            ASYNC_ERRORS = (aiohttp.ClientConnectionError, OSError, asyncio.TimeoutError)
+        except ImportError:
+            ASYNC_ERRORS = (OSError, asyncio.TimeoutError)
+    return ASYNC_ERRORS
+
+
+def backoff(attempt):
+    return min(MAX_BACKOFF, BACKOFF * 2 ** attempt) * random.uniform(0.5, 1)
+
+
+def hold(r, host, status, wait, *names):
+    # keeps the host slot until one of the response's close methods runs
+    # a response dropped without closing gives it back when collected
+    done = weakref.finalize(r, host.release, status, wait)
+    for name in names:
+        def close(method=getattr(r, name)):
+            done()
+            return method()
+        setattr(r, name, close)
+
+
+def get(session, url, **kwargs):
+    return request(session, 'GET', url, **kwargs)
+
+
+def head(session, url, **kwargs):
+    return request(session, 'HEAD', url, allow_redirects=True, **kwargs)
+
+
+def request(session, method, url, **kwargs):
+    # session.request through the host limiter, retrying connection errors and RETRY_STATUS with backoff
+    # the last response is returned as is, callers check the status
+    host = limiter(url)
+    for attempt in range(RETRIES + 1):
+        host.acquire()
+        try:
+            r = session.request(method, url, **kwargs)
+        except OSError:
+            host.release()
+            if attempt == RETRIES:
+                raise
+            time.sleep(backoff(attempt))
+            continue
+        wait = retry_after(r.headers.get('Retry-After'))
+        if kwargs.get('stream'):
+            # the body is still to be read, it counts against the window until the response is closed
+            hold(r, host, r.status_code, wait, 'close')
+        else:
+            host.release(r.status_code, wait)
+        if r.status_code not in RETRY_STATUS or attempt == RETRIES:
+            return r
+        r.close()
+        # a longer retry-after is cut, blocking the caller that long isn't worth it
+        time.sleep(min(wait, MAX_BACKOFF) if wait is not None else backoff(attempt))
+
+
+async def get_async(session, url, **kwargs):
+    return await request_async(session, 'GET', url, **kwargs)
+
+
+async def head_async(session, url, **kwargs):
+    return await request_async(session, 'HEAD', url, allow_redirects=True, **kwargs)
+
+
+async def request_async(session, method, url, **kwargs):
+    # aiohttp version of request, use the response with 'async with'
+    host = limiter(url)
+    for attempt in range(RETRIES + 1):
+        await host.acquire_async()
+        try:
+            r = await session.request(method, url, **kwargs)
+        except async_errors():
+            host.release()
+            if attempt == RETRIES:
+                raise
+            await asyncio.sleep(backoff(attempt))
+            continue
+        wait = retry_after(r.headers.get('Retry-After'))
+        hold(r, host, r.status, wait, 'release', 'close')
+        if r.status not in RETRY_STATUS or attempt == RETRIES:
+            return r
+        r.release()
+        await asyncio.sleep(min(wait, MAX_BACKOFF) if wait is not None else backoff(attempt))
+
+
+class StatusError(Exception):
+    def __init__(self, status):
+        Exception.__init__(self, f'http status {status}')
+        self.status = status
+
+
+def gone(expt):
+    return isinstance(expt, StatusError) and expt.status in GONE_STATUS
+
+
+def transient(expt):
+    # still failing after the retries, a later run may get through
+    if isinstance(expt, StatusError):
+        return expt.status in RETRY_STATUS
+    if isinstance(expt, (OSError, asyncio.TimeoutError)):
+        return True
+    # other aiohttp errors only come from the async engine, which has loaded it
+    return 'aiohttp' in sys.modules and isinstance(expt, async_errors())
+
+
+def check_page(status):
+    # listing and article pages, 304 is handled by the page cache
+    if status >= 400:
+        raise StatusError(status)
+
+
+def check_media(status, content_type):
+    # refuse to save error pages as media
+    if status not in (200, 206):
+        raise StatusError(status)
+    if content_type and content_type.split(';')[0].strip().lower().startswith('text/'):
+        raise Exception(f'unexpected content type {content_type}')